@@ -0,0 +1,66 @@
+"""
+bench_event_queue.py
+
+Compare the event queue backends with the classic "hold" model: the queue is filled
+with N events, then every operation pops the earliest event and pushes a new one at
+an exponentially distributed offset from it, like the delays drawn in Node.compute_delay.
+
+Usage:
+    python benchmarks/bench_event_queue.py [--sizes 1000 10000 100000] [--ops 200000] [--seed 1]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from events import Event, QUEUE_BACKENDS, TXN_RECV  # noqa: E402
+
+
+def hold(backend, size, ops, seed):
+    """run the hold model on one backend, returns (ops per second, ids of popped events)"""
+    rng = np.random.default_rng(seed)
+    initial = rng.exponential(1.0, size)
+    # mixture of short link delays and long mining/interarrival times
+    offsets = np.where(rng.uniform(0, 1, ops) < 0.9, rng.exponential(0.1, ops), rng.exponential(10.0, ops))
+
+    queue = QUEUE_BACKENDS[backend]()
+    queue.push_many([Event(t, 0, i, TXN_RECV) for i, t in enumerate(initial.tolist())])
+
+    popped = []
+    start = time.perf_counter()
+    for i, offset in enumerate(offsets.tolist()):
+        event = queue.pop()
+        popped.append(event.receiver_id)
+        queue.push(Event(event.time + offset, 0, size + i, TXN_RECV))
+    elapsed = time.perf_counter() - start
+    return ops / elapsed, popped
+
+
+def main():
+    """run the benchmark for every backend and queue size"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--ops", type=int, default=200000, help="hold operations per run")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    backends = list(QUEUE_BACKENDS)
+    print(f"{'size':>10} " + " ".join(f"{backend + ' ops/s':>16}" for backend in backends) + "  same order")
+    for size in args.sizes:
+        rates = []
+        orders = []
+        for backend in backends:
+            rate, order = hold(backend, size, args.ops, args.seed)
+            rates.append(rate)
+            orders.append(order)
+        same_order = all(order == orders[0] for order in orders)
+        print(f"{size:>10} " + " ".join(f"{rate:>16,.0f}" for rate in rates) + f"  {same_order}")
+
+
+if __name__ == "__main__":
+    main()
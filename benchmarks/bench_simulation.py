@@ -0,0 +1,239 @@
+"""
+bench_simulation.py
+
+Benchmark whole simulation runs. Every case is a fixed configuration with a fixed seed, so two runs of the
+same code simulate exactly the same events and only the time they take differs. The cases sweep one option
+of a base configuration at a time: total_nodes, execution_time, mean_interarrival_time_sec and max_txn_in_block.
+
+Each case runs in a fresh process and reports:
+    - setup_time_sec: Network() and prepare_simulation, mostly the topology and the nodes
+    - events_per_sec: events executed per second of Network.start_simulation
+    - peak_rss_mb: peak resident memory of the process
+    - handlers: calls, total seconds and mean microseconds per event kind, measured on a second run of the
+      same case with instrumentation.EventLoopStats, so it doesn't slow down the run events_per_sec is taken from
+
+The results are written as JSON. Given a baseline, a previous result file, the cases are compared with it
+and the script exits with status 1 if a case got slower or bigger than the tolerance allows. Timings below
+MIN_TIMED_SEC, like the setup of small networks, are too noisy to judge and are never counted as regressions.
+
+Usage:
+    python benchmarks/bench_simulation.py [--sweeps total_nodes execution_time ...] [--repeat 3]
+                                          [--output bench.json] [--baseline bench_baseline.json] [--tolerance 0.1]
+"""
+
+import argparse
+import configparser
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from cache import code_version  # noqa: E402
+from instrumentation import EventLoopStats  # noqa: E402
+from logger import init_logger  # noqa: E402
+from network import Network  # noqa: E402
+
+# Base of every case, kept here rather than read from config.ini so the cases never change with it
+BASE_CONFIG = {
+    "simulation": {
+        "execution_time": "100",
+        "total_nodes": "50",
+        "percent_slow_nodes": "20",
+        "percent_low_cpu_nodes": "20",
+        "output_dir": "output",
+        "debug": "False",
+        "dark_mode": "False",
+        "event_queue": "heap",
+        "seed": "1",
+    },
+    "node": {
+        "min_neighbors": "3",
+        "max_neighbors": "6",
+        "adversary_one_mining_power": "30",
+        "adversary_two_mining_power": "20",
+        "max_orphan_blocks": "256",
+        "seen_set": "exact",
+    },
+    "transaction": {"size": "1", "mean_interarrival_time_sec": "4"},
+    "network": {
+        "min_light_prop_delay": "0.010",
+        "max_light_prop_delay": "0.500",
+        "slow_node_link_speed": "5",
+        "fast_node_link_speed": "100",
+        "queuing_delay_constant": "96",
+        "relay_mode": "immediate",
+    },
+    "mining": {"mean_mining_time_sec": "5", "mining_reward": "50", "max_txn_in_block": "1000"},
+}
+
+# sweep name -> (section, option, values), the other options keep their base values
+SWEEPS = {
+    "total_nodes": ("simulation", "total_nodes", ["25", "50", "100"]),
+    "execution_time": ("simulation", "execution_time", ["50", "100", "200"]),
+    "mean_interarrival_time_sec": ("transaction", "mean_interarrival_time_sec", ["1", "4", "16"]),
+    "max_txn_in_block": ("mining", "max_txn_in_block", ["10", "100", "1000"]),
+}
+
+# Metrics compared with the baseline, all of them are better when lower except events_per_sec
+COMPARED_METRICS = ("events_per_sec", "setup_time_sec", "peak_rss_mb")
+# Timings shorter than this are mostly noise, they are shown but never counted as a regression
+MIN_TIMED_SEC = 0.05
+
+
+def case_config(section, option, value):
+    """return the base configuration with one option changed, as {section: {option: value}}"""
+    sections = {name: dict(options) for name, options in BASE_CONFIG.items()}
+    sections[section][option] = value
+    return sections
+
+
+def build_network(sections):
+    """create and prepare the network of a configuration, returns (network, setup time in seconds)"""
+    config = configparser.ConfigParser()
+    config.read_dict(sections)
+    start = time.perf_counter()
+    network = Network(config, type="toml")
+    network.prepare_simulation()
+    return network, time.perf_counter() - start
+
+
+def run_case(sections):
+    """run one case in the current process and return its measurements"""
+    init_logger("ERROR")
+    with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+        network, setup_time = build_network(sections)
+        start = time.perf_counter()
+        network.start_simulation()
+        run_time = time.perf_counter() - start
+        metrics = network.collect_metrics()
+        peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # kilobytes on Linux
+        if sys.platform == "darwin":
+            peak_rss_kb /= 1024  # bytes on macOS
+
+        del network
+        network, _ = build_network(sections)
+        stats = EventLoopStats()
+        network.start_simulation(stats)
+        events = stats.report(network)["events"]
+
+    return {
+        "setup_time_sec": setup_time,
+        "run_time_sec": run_time,
+        "events_executed": metrics["events_executed"],
+        "events_per_sec": metrics["events_executed"] / run_time if run_time > 0 else 0.0,
+        "peak_rss_mb": peak_rss_kb / 1024,
+        "total_blocks": metrics["total_blocks"],
+        "handlers": {
+            name: {
+                "calls": event["calls"],
+                "total_sec": event["handler_time_sec"],
+                "mean_us": event["mean_handler_time_us"],
+            }
+            for name, event in events.items()
+            if event["calls"]
+        },
+    }
+
+
+def run_isolated(sections):
+    """run one case in a fresh process, so its peak RSS isn't the one of an earlier case"""
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(run_case, (sections,))
+
+
+def best_of(results):
+    """merge repeated runs of a case, keeping the best value of every timing and the largest peak RSS"""
+    best = dict(results[0])
+    best["setup_time_sec"] = min(result["setup_time_sec"] for result in results)
+    best["run_time_sec"] = min(result["run_time_sec"] for result in results)
+    best["events_per_sec"] = max(result["events_per_sec"] for result in results)
+    best["peak_rss_mb"] = max(result["peak_rss_mb"] for result in results)
+    best["handlers"] = min((result["handlers"] for result in results),
+                           key=lambda handlers: sum(entry["total_sec"] for entry in handlers.values()))
+    return best
+
+
+def compare(cases, baseline, tolerance):
+    """print the ratio of every compared metric to the baseline, return the names of the regressed cases"""
+    regressions = []
+    print(f"\n{'case':<36} " + " ".join(f"{metric:>16}" for metric in COMPARED_METRICS))
+    for name, result in cases.items():
+        previous = baseline.get(name)
+        if previous is None:
+            print(f"{name:<36} {'not in baseline':>16}")
+            continue
+        if previous["events_executed"] != result["events_executed"]:
+            print(f"{name:<36} simulated {result['events_executed']} events, the baseline "
+                  f"{previous['events_executed']}, the timings aren't comparable")
+        ratios = []
+        regressed = False
+        for metric in COMPARED_METRICS:
+            ratio = result[metric] / previous[metric] if previous[metric] else float("nan")
+            ratios.append(ratio)
+            if metric == "events_per_sec":
+                timed = min(result["run_time_sec"], previous["run_time_sec"])
+                regressed |= timed >= MIN_TIMED_SEC and ratio < 1 - tolerance
+            elif metric == "setup_time_sec":
+                timed = min(result[metric], previous[metric])
+                regressed |= timed >= MIN_TIMED_SEC and ratio > 1 + tolerance
+            else:
+                regressed |= ratio > 1 + tolerance
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<36} " + " ".join(f"{ratio:>15.2f}x" for ratio in ratios) + ("  REGRESSION" if regressed else ""))
+    return regressions
+
+
+def main():
+    """run the selected sweeps, write the results and compare them with the baseline if given"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sweeps", nargs="+", choices=list(SWEEPS), default=list(SWEEPS))
+    parser.add_argument("--repeat", type=int, default=3, help="runs of every case, the best one is kept")
+    parser.add_argument("--output", type=str, default="bench_simulation.json")
+    parser.add_argument("--baseline", type=str, default=None, help="earlier result file to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="relative change counted as a regression")
+    args = parser.parse_args()
+
+    cases = {}
+    print(f"{'case':<36} {'setup s':>9} {'events':>10} {'events/s':>12} {'peak MB':>9}")
+    for sweep in args.sweeps:
+        section, option, values = SWEEPS[sweep]
+        for value in values:
+            name = f"{sweep}={value}"
+            if name in cases:
+                continue
+            sections = case_config(section, option, value)
+            result = best_of([run_isolated(sections) for _ in range(args.repeat)])
+            result["config"] = sections
+            cases[name] = result
+            print(f"{name:<36} {result['setup_time_sec']:>9.3f} {result['events_executed']:>10} "
+                  f"{result['events_per_sec']:>12,.0f} {result['peak_rss_mb']:>9.1f}")
+
+    output = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "code_version": code_version(),
+        "repeat": args.repeat,
+        "cases": cases,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(output, f, indent=2)
+    print(f"\n{len(cases)} cases written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["cases"]
+        regressions = compare(cases, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} cases regressed by more than {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,36 +1,57 @@
 """Module to represent a block in the blockchain"""
 
 from hashlib import sha256
+import numpy as np
+
+
+def merkle_root(digests):
+    """return the merkle root of a list of digests, an odd one out is paired with itself like in Bitcoin"""
+    level = list(digests)
+    if not level:
+        return sha256(b"").digest()
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+        level = [sha256(level[i] + level[i + 1]).digest() for i in range(0, len(level), 2)]
+    return level[0]
 
 
 class Block:
-    """Class to represent a block in the blockchain"""
-    def __init__(self, creation_time, prev_hash, height, transactions, mine_time=0.0):
+    """Class to represent a block in the blockchain
+
+    Blocks are immutable once created, so a single instance is shared by every node that
+    receives it. Per-node information, like the time an adversary released the block,
+    is kept by the node itself. The transactions are held as an array of ids into the
+    TransactionTable, the coinbase transaction first.
+    """
+    __slots__ = ("prev_hash", "creation_time", "height", "txns", "merkle_root", "hash", "mine_time")
 
-        self.prev_hash = prev_hash
-        self.creation_time = creation_time
-        self.height = height  # height of block in chain from genesis block
-        self.txns = transactions
+    def __init__(self, creation_time, prev_hash, height, transactions, txn_table, mine_time=0.0):
+        set_field = object.__setattr__
+        set_field(self, "prev_hash", prev_hash)
+        set_field(self, "creation_time", creation_time)
+        set_field(self, "height", height)  # height of block in chain from genesis block
+        txns = np.array(transactions, dtype=np.int64)
+        txns.flags.writeable = False
+        set_field(self, "txns", txns)
+        set_field(self, "merkle_root", merkle_root(txn_table.digests(txns)))
 
         # these are not included in the block-hash
-        self.hash = self.block_hash()  # unique ID for every block
-        self.mine_time = mine_time
-        self.release_time = 0.0 # TODO: remove this
+        set_field(self, "hash", self.block_hash())  # unique ID for every block
+        set_field(self, "mine_time", mine_time)  # time at which the miner finds the block
 
-    def block_hash(self):
-        """method to calculate hash of a block"""
-        # txns_string = ""
-        # for txn in self.txns:
-        #     txns_string += str(txn)
-        # txn_hash = sha256(txns_string.encode()).hexdigest()
+    def __setattr__(self, name, value):
+        raise AttributeError(f"Block is immutable, can't set '{name}'")
 
-        # block_content = str(self.height) + str(self.prev_hash) + txn_hash
-        self.hash = sha256(str(self).encode()).hexdigest()[:32]
+    def __delattr__(self, name):
+        raise AttributeError(f"Block is immutable, can't delete '{name}'")
 
-        return self.hash
+    def block_hash(self):
+        """method to calculate hash of a block from its header, the transactions enter through the merkle root"""
+        return sha256(str(self).encode()).hexdigest()[:32]
 
     def __str__(self):
-        return f"Block {self.height} {self.prev_hash} {self.creation_time} {[txn.__str_v2__() for txn in self.txns]}"
+        return f"Block {self.height} {self.prev_hash} {self.creation_time} {self.merkle_root.hex()}"
 
     def __str_v2__(self):
         return f"{self.hash},{self.height},{self.mine_time},{len(self.txns)},{self.prev_hash}"
@@ -44,3 +65,105 @@ class Block:
     def prev_hash_s(self):
         """Shortened prev_hash for display"""
         return self.prev_hash[:7] if self.prev_hash != -1 else -1
+
+
+def skip_height(height):
+    """return the height the skip pointer of a block at the given height points to, like Bitcoin's GetSkipHeight"""
+    if height < 2:
+        return 0
+    # clear the lowest set bit once for even heights and twice for odd ones, so pointers
+    # of consecutive blocks reach far apart and any ancestor is found in O(log n) jumps
+    if height & 1:
+        height = (height - 1) & (height - 2)
+        return (height & (height - 1)) + 1
+    return height & (height - 1)
+
+
+class BlockStore:
+    """Class to hold every block of the simulation once, shared by all the nodes
+
+    Nodes only keep the hashes of the blocks they know about and look the blocks up here.
+    Every block also gets a skip pointer to one of its ancestors, as in Bitcoin Core, so
+    the ancestor of a block at any height and the fork point of two branches are found
+    in O(log n) steps instead of walking the chain back one block at a time.
+    """
+
+    def __init__(self):
+        self.blocks = {}  # Hash -> Block
+        self.skips = {}  # Hash -> Hash of the ancestor at skip_height(height), -1 for genesis
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def __contains__(self, block_hash):
+        return block_hash in self.blocks
+
+    def __getitem__(self, block_hash):
+        return self.blocks[block_hash]
+
+    def __iter__(self):
+        return iter(self.blocks)
+
+    def add(self, block):
+        """add a block to the store, does nothing if it is already there, its parent must be there"""
+        if block.hash in self.blocks:
+            return
+        self.blocks[block.hash] = block
+        if block.prev_hash == -1:
+            self.skips[block.hash] = -1
+        else:
+            self.skips[block.hash] = self.ancestor(block.prev_hash, skip_height(block.height))
+
+    def values(self):
+        """return all the blocks of the store"""
+        return self.blocks.values()
+
+    def ancestor(self, block_hash, height):
+        """return the hash of the ancestor of a block at the given height, or the block itself at its own height"""
+        walk_height = self.blocks[block_hash].height
+        if not 0 <= height <= walk_height:
+            raise ValueError(f"Block {block_hash} at height {walk_height} has no ancestor at height {height}")
+        walk = block_hash
+        while walk_height > height:
+            # take the skip pointer unless it overshoots, or the parent's pointer gets closer
+            jump_height = skip_height(walk_height)
+            prev_jump_height = skip_height(walk_height - 1)
+            if jump_height == height or (
+                jump_height > height and not (prev_jump_height < jump_height - 2 and prev_jump_height >= height)
+            ):
+                walk = self.skips[walk]
+                walk_height = jump_height
+            else:
+                walk = self.blocks[walk].prev_hash
+                walk_height -= 1
+        return walk
+
+    def fork_point(self, hash_a, hash_b):
+        """return the hash of the last common ancestor of two blocks
+
+        Both blocks are first brought to the same height. Then the distance to the fork
+        is bracketed by doubling steps, which keeps the usual shallow forks cheap, and
+        found by binary search inside the bracket. All chains share the genesis block.
+        """
+        height = min(self.blocks[hash_a].height, self.blocks[hash_b].height)
+        hash_a = self.ancestor(hash_a, height)
+        hash_b = self.ancestor(hash_b, height)
+        if hash_a == hash_b:
+            return hash_a
+
+        # heights where the branches are known to differ (high) and to agree (low)
+        high = height
+        step = 1
+        while True:
+            low = max(0, high - step)
+            if low == 0 or self.ancestor(hash_a, low) == self.ancestor(hash_b, low):
+                break
+            high = low
+            step *= 2
+        while high - low > 1:
+            middle = (low + high) // 2
+            if self.ancestor(hash_a, middle) == self.ancestor(hash_b, middle):
+                low = middle
+            else:
+                high = middle
+        return self.ancestor(hash_a, low)
@@ -0,0 +1,136 @@
+"""module to keep the results of simulation runs on disk, addressed by a hash of what produced them"""
+
+from functools import lru_cache
+import glob
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+# Options that change where or how results are shown, or how fast they are computed, but not the results themselves:
+# both event queue backends pop events in the same order and a cached topology is the one its seed would build
+IGNORED_OPTIONS = {
+    ("simulation", "debug"),
+    ("simulation", "output_dir"),
+    ("simulation", "dark_mode"),
+    ("simulation", "seed"),
+    ("simulation", "result_cache"),
+    ("simulation", "result_cache_max_mb"),
+    ("simulation", "log_file"),
+    ("simulation", "log_file_max_mb"),
+    ("simulation", "log_file_backups"),
+    ("simulation", "log_async"),
+    ("simulation", "log_queue_size"),
+    ("simulation", "log_overflow"),
+    ("simulation", "event_queue"),
+    ("network", "topology_cache"),
+}
+SIMULATION_SECTIONS = ("simulation", "node", "transaction", "network", "mining")
+
+
+@lru_cache(maxsize=None)
+def code_version():
+    """return a hash of the source of the simulator, so results of older code are never reused"""
+    digest = hashlib.sha256()
+    for path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "*.py"))):
+        digest.update(os.path.basename(path).encode())
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def run_key(config, seed):
+    """return the cache key of a run, a hash of the normalized simulation sections, the seed and the code version
+
+    config maps section names to {option: value}, like a ConfigParser. Options are
+    sorted and stripped, so the formatting of the config file doesn't matter.
+    """
+    normalized = {
+        section: {
+            option: str(value).strip()
+            for option, value in sorted(config[section].items())
+            if (section, option) not in IGNORED_OPTIONS
+        }
+        for section in SIMULATION_SECTIONS
+        if section in config
+    }
+    payload = json.dumps({"config": normalized, "seed": seed, "code": code_version()}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResultCache:
+    """Class to store the metrics and output files of simulation runs in a directory
+
+    Every run is an entry directory named by its key, holding metrics.json and copies of
+    the output files. Reading an entry refreshes its modification time, and whenever the
+    cache grows over max_bytes the least recently used entries are deleted.
+    """
+
+    METRICS_FILE = "metrics.json"
+
+    def __init__(self, directory, max_bytes=1 << 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def entry_path(self, key):
+        """return the directory of an entry"""
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        """return (metrics, {file name: path}) of an entry, or None if it isn't cached"""
+        path = self.entry_path(key)
+        metrics_path = os.path.join(path, self.METRICS_FILE)
+        try:
+            with open(metrics_path, encoding="utf-8") as f:
+                metrics = json.load(f)
+        except (OSError, ValueError):
+            return None
+        os.utime(metrics_path)  # mark as recently used
+        files = {name: os.path.join(path, name) for name in os.listdir(path) if name != self.METRICS_FILE}
+        return metrics, files
+
+    def put(self, key, metrics, files=()):
+        """store the metrics and copies of the given files of a run, replacing an older entry with the same key"""
+        staging = tempfile.mkdtemp(dir=self.directory, prefix=".staging-")
+        for file_path in files:
+            shutil.copy(file_path, staging)
+        with open(os.path.join(staging, self.METRICS_FILE), "w", encoding="utf-8") as f:
+            json.dump(metrics, f)
+
+        # the entry appears complete or not at all
+        path = self.entry_path(key)
+        if os.path.exists(path):
+            shutil.rmtree(path, ignore_errors=True)
+        try:
+            os.rename(staging, path)
+        except OSError:
+            # another process stored the same run meanwhile
+            shutil.rmtree(staging, ignore_errors=True)
+        self.evict()
+
+    def entries(self):
+        """return (last use time, size in bytes, path) of every entry"""
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            metrics_path = os.path.join(path, self.METRICS_FILE)
+            if name.startswith("."):
+                continue
+            try:
+                size = sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+                entries.append((os.stat(metrics_path).st_mtime, size, path))
+            except OSError:
+                continue  # not an entry, or evicted by another process meanwhile
+        return entries
+
+    def evict(self):
+        """delete the least recently used entries until the cache fits in max_bytes"""
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
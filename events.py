@@ -1,37 +1,279 @@
 """module to create and handle events and event queue"""
 
-from queue import PriorityQueue
+import heapq
+from bisect import insort
+from itertools import count
+
+# Event kinds, used as indices into the dispatch table of a node (see Node.handlers)
+TXN_CREATE = 0
+TXN_RECV = 1
+BLK_MINE = 2
+BLK_RECV = 3
+TXN_FLUSH = 4  # batched relay only, a node sends the transactions it buffered
+TXN_BATCH_RECV = 5  # batched relay only, a node receives a batch of transactions
+EVENT_NAMES = ("txn_create", "txn_recv", "blk_mine", "blk_recv", "txn_flush", "txn_batch_recv")
 
 
 class EventQueue:
-    """Class to represent a queue of events in the network simulation"""
+    """Class to represent a queue of events in the network simulation
+
+    Events are kept in a binary heap of (time, seq, event) entries. The sequence
+    number is taken from a monotonic counter, so events scheduled for the same time
+    are popped in the order they were pushed. The simulation loop is single-threaded,
+    so no locking is done.
+
+    Cancelled events stay in the heap and are skipped when they reach the top.
+    Popped events are marked so that cancelling them later leaves the counters alone.
+    """
     def __init__(self):
-        self.queue = PriorityQueue()
+        self.queue = []
+        self.counter = count()
+        self.size = 0  # number of events in the heap that are not cancelled
+        self.cancelled_count = 0
+        self.executed_count = 0
+
+    def __len__(self):
+        return self.size
 
     def push(self, event):
         """Add an event to the queue"""
-        self.queue.put(event)
+        heapq.heappush(self.queue, (event.time, next(self.counter), event))
+        self.size += 1
+
+    def push_many(self, events):
+        """Add several events to the queue, preserving their order for equal times"""
+        counter = self.counter
+        self.push_entries([(event.time, next(counter), event) for event in events])
+
+    def multicast(self, time, sender_id, type, data, links):
+        """Add one event of the given type and data per (receiver_id, delay) link, each at time + delay
+
+        Used for broadcasts, the events are created and queued in one batch, in the order of the links.
+        """
+        counter = self.counter
+        self.push_entries(
+            [
+                (time + delay, next(counter), Event(time + delay, sender_id, receiver_id, type, data))
+                for receiver_id, delay in links
+            ]
+        )
+
+    def push_entries(self, entries):
+        """Add a batch of (time, seq, event) entries, heapifying once if the batch outnumbers the queue"""
+        self.size += len(entries)
+        queue = self.queue
+        if len(entries) > len(queue):
+            queue.extend(entries)
+            heapq.heapify(queue)
+        else:
+            heappush = heapq.heappush
+            for entry in entries:
+                heappush(queue, entry)
 
     def pop(self):
         """Remove and return the next event from the queue"""
-        return self.queue.get(block=False)
+        event = heapq.heappop(self.queue)[2]
+        while event.cancelled:
+            event = heapq.heappop(self.queue)[2]
+        event.popped = True
+        self.size -= 1
+        self.executed_count += 1
+        return event
+
+    def peek(self):
+        """Return the next event without removing it, None if the queue is empty"""
+        while self.queue and self.queue[0][2].cancelled:
+            heapq.heappop(self.queue)
+        return self.queue[0][2] if self.queue else None
+
+    def cancel(self, event):
+        """Cancel a pending event, it will be dropped when it reaches the top of the queue
+
+        Cancelling an event that was already cancelled or popped does nothing.
+        """
+        if event.cancelled or event.popped:
+            return
+        event.cancelled = True
+        event.data = None  # release the payload right away
+        self.size -= 1
+        self.cancelled_count += 1
+
+        # Rebuild the queue once cancelled entries outnumber the live ones
+        if self.stored_count() > 2 * self.size + 1024:
+            self.compact()
+
+    def stored_count(self):
+        """Return the number of stored entries, including cancelled ones"""
+        return len(self.queue)
+
+    def compact(self):
+        """Drop cancelled entries from the heap"""
+        self.queue = [entry for entry in self.queue if not entry[2].cancelled]
+        heapq.heapify(self.queue)
 
     def print(self):
         """Print the event queue"""
         print(self.queue)
 
 
+class CalendarQueue(EventQueue):
+    """Calendar queue (R. Brown, 1988) with amortized O(1) push and pop
+
+    Entries are hashed by time into a ring of buckets, each bucket covering
+    `width` seconds of simulation time and holding a short sorted list. Popping
+    walks the ring starting at the bucket of the last popped event. The number of
+    buckets doubles or halves with the number of entries and the width is then
+    re-estimated from the spacing of the earliest pending events, which keeps the
+    buckets short for the exponential delays drawn by the nodes.
+
+    Entries are the same (time, seq, event) tuples as in EventQueue, so events are
+    popped in exactly the same order.
+    """
+    MIN_BUCKETS = 2
+
+    def __init__(self, bucket_width=1.0):
+        super().__init__()
+        self.queue = None
+        self.width = bucket_width
+        self.buckets = [[] for _ in range(self.MIN_BUCKETS)]
+        self.current = 0  # virtual bucket (time // width) where the next search starts
+        self.entries = 0  # stored entries, including cancelled ones
+
+    def push(self, event):
+        """Add an event to the queue"""
+        virtual_bucket = int(event.time // self.width)
+        if virtual_bucket < self.current:
+            # events may be scheduled before the last popped one, restart the search there
+            self.current = virtual_bucket
+        buckets = self.buckets
+        insort(buckets[virtual_bucket % len(buckets)], (event.time, next(self.counter), event))
+        self.entries += 1
+        self.size += 1
+        if self.entries > 2 * len(buckets):
+            self.resize(2 * len(buckets))
+
+    def push_entries(self, entries):
+        """Add a batch of (time, seq, event) entries, resizing at most once"""
+        for entry in entries:
+            self.insert(entry)
+        self.size += len(entries)
+        num_buckets = len(self.buckets)
+        while self.entries > 2 * num_buckets:
+            num_buckets *= 2
+        if num_buckets != len(self.buckets):
+            self.resize(num_buckets)
+
+    def insert(self, entry):
+        """Put an entry in its bucket"""
+        virtual_bucket = int(entry[0] // self.width)
+        if virtual_bucket < self.current:
+            self.current = virtual_bucket
+        insort(self.buckets[virtual_bucket % len(self.buckets)], entry)
+        self.entries += 1
+
+    def find(self):
+        """Return the index of the bucket holding the earliest entry"""
+        buckets = self.buckets
+        num_buckets = len(buckets)
+        width = self.width
+        for virtual_bucket in range(self.current, self.current + num_buckets):
+            bucket = buckets[virtual_bucket % num_buckets]
+            if bucket and bucket[0][0] // width <= virtual_bucket:
+                self.current = virtual_bucket
+                return virtual_bucket % num_buckets
+
+        # Nothing due within a whole year of the calendar, jump to the earliest entry
+        earliest = min(bucket[0] for bucket in buckets if bucket)
+        self.current = int(earliest[0] // width)
+        return self.current % num_buckets
+
+    def extract(self):
+        """Remove and return the earliest entry"""
+        entry = self.buckets[self.find()].pop(0)
+        self.entries -= 1
+        if self.entries < len(self.buckets) // 2 and len(self.buckets) > self.MIN_BUCKETS:
+            self.resize(len(self.buckets) // 2)
+        return entry
+
+    def pop(self):
+        """Remove and return the next event from the queue"""
+        event = self.extract()[2]
+        while event.cancelled:
+            event = self.extract()[2]
+        event.popped = True
+        self.size -= 1
+        self.executed_count += 1
+        return event
+
+    def peek(self):
+        """Return the next event without removing it, None if the queue is empty"""
+        while self.entries:
+            bucket = self.buckets[self.find()]
+            if not bucket[0][2].cancelled:
+                return bucket[0][2]
+            self.extract()
+        return None
+
+    def stored_count(self):
+        """Return the number of stored entries, including cancelled ones"""
+        return self.entries
+
+    def compact(self):
+        """Drop cancelled entries from the buckets"""
+        self.resize(len(self.buckets))
+
+    def resize(self, num_buckets):
+        """Rehash all live entries into num_buckets buckets of a freshly estimated width"""
+        entries = [entry for bucket in self.buckets for entry in bucket if not entry[2].cancelled]
+        self.width = self.estimate_width(entries)
+        self.buckets = [[] for _ in range(max(num_buckets, self.MIN_BUCKETS))]
+        self.current = int(min(entries)[0] // self.width) if entries else 0
+        self.entries = 0
+        for entry in sorted(entries):
+            self.insert(entry)
+
+    def estimate_width(self, entries, samples=25):
+        """Return a bucket width of about three times the spacing of the earliest entries"""
+        times = [entry[0] for entry in heapq.nsmallest(samples, entries)]
+        gaps = [later - earlier for earlier, later in zip(times, times[1:])]
+        if not gaps:
+            return self.width
+        mean_gap = sum(gaps) / len(gaps)
+        # ignore the few large gaps that would otherwise dominate the mean
+        gaps = [gap for gap in gaps if gap <= 2 * mean_gap]
+        mean_gap = sum(gaps) / len(gaps)
+        return 3 * mean_gap if mean_gap > 0 else self.width
+
+    def print(self):
+        """Print the event queue"""
+        print(self.buckets)
+
+
+QUEUE_BACKENDS = {"heap": EventQueue, "calendar": CalendarQueue}
+
+
+def make_event_queue(backend="heap"):
+    """Create an empty event queue of the given backend"""
+    if backend not in QUEUE_BACKENDS:
+        raise ValueError(f"Unknown event queue backend '{backend}', expected one of {list(QUEUE_BACKENDS)}")
+    return QUEUE_BACKENDS[backend]()
+
+
 class Event:
     """Class to represent an event in the network simulation"""
+    __slots__ = ("time", "sender_id", "receiver_id", "type", "data", "cancelled", "popped")
+
     def __init__(self, time, sender_id, receiver_id, type, data=None):
         self.time = time
         self.sender_id = sender_id
         self.receiver_id = receiver_id
         self.type = type
         self.data = data
+        self.cancelled = False
+        self.popped = False
 
     def __lt__(self, other):
         return self.time < other.time
 
     def __str__(self):
-        return f"Event -> type={self.type} sender={self.sender_id} receiver={self.receiver_id}"
+        return f"Event -> type={EVENT_NAMES[self.type]} sender={self.sender_id} receiver={self.receiver_id}"
@@ -0,0 +1,146 @@
+"""module to measure where a simulation spends its time, without slowing it down when it is off"""
+
+from contextlib import contextmanager
+import cProfile
+import json
+import time
+
+from events import EVENT_NAMES, BLK_MINE
+from logger import log
+
+
+class EventLoopStats:
+    """Class to run the event loop of a network with counters around every handler
+
+    Network.start_simulation runs this loop instead of its own when given an instance,
+    so the plain loop never pays for the counters. It records the calls and handler time
+    of every event kind, the high-water mark of the event queue, the stale blk_mine events,
+    the reorgs and their depths, and the orphan blocks. A blk_mine event is stale when
+    mining restarted before it was due: its timer is then cancelled in the queue, the only
+    events that are, or if it still comes out its block is discarded by the handler; both
+    are counted. Reorgs are seen through a wrapper around the switch_branch of every node,
+    installed by run() on the node instances only.
+    """
+
+    def __init__(self):
+        self.calls = [0] * len(EVENT_NAMES)
+        self.handler_time = [0.0] * len(EVENT_NAMES)
+        self.queue_high_water = 0
+        self.stale_mines = 0
+        self.reorg_depths = {}  # blocks undone -> number of reorgs
+        self.loop_time = 0.0
+
+    def record_reorgs(self, node):
+        """wrap switch_branch of one node to count its reorgs"""
+        switch_branch = node.switch_branch
+        reorg_depths = self.reorg_depths
+
+        def counted_switch_branch(old_leaf_hash, new_leaf_hash):
+            depth = switch_branch(old_leaf_hash, new_leaf_hash)
+            if depth > 0:  # moving forward along the same chain undoes nothing and isn't a reorg
+                reorg_depths[depth] = reorg_depths.get(depth, 0) + 1
+            return depth
+
+        node.switch_branch = counted_switch_branch
+
+    def run(self, network):
+        """run the events of the network until the queue is empty or the execution time is up"""
+        for node in network.nodes:
+            self.record_reorgs(node)
+
+        event_queue = network.event_queue
+        nodes = network.nodes
+        handlers = [node.handlers for node in nodes]
+        calls = self.calls
+        handler_time = self.handler_time
+        queue_high_water = len(event_queue)
+        cancelled_at_start = event_queue.cancelled_count
+        clock = time.perf_counter
+        loop_start = clock()
+        while True:
+            if event_queue:
+                event = event_queue.pop()
+            else:
+                log.info("No more events in event queue. Exiting Simulation.")
+                break
+
+            network.time = event.time
+
+            if event.time > network.execution_time:
+                log.info("Simulation time is up. Exiting Simulation.")
+                break
+
+            event_type = event.type
+            start = clock()
+            handlers[event.receiver_id][event_type](event.data, event.sender_id)
+            handler_time[event_type] += clock() - start
+            calls[event_type] += 1
+
+            # a mined block that came out of the queue but wasn't added was discarded as stale
+            if event_type == BLK_MINE and event.data.hash not in nodes[event.receiver_id].known_blocks:
+                self.stale_mines += 1
+            if len(event_queue) > queue_high_water:
+                queue_high_water = len(event_queue)
+
+        self.loop_time += clock() - loop_start
+        self.stale_mines += event_queue.cancelled_count - cancelled_at_start
+        self.queue_high_water = max(self.queue_high_water, queue_high_water)
+
+    def report(self, network):
+        """return the counters and the orphan pools of the network as a dictionary"""
+        pools = [node.pending_blocks for node in network.nodes]
+        return {
+            "loop_time_sec": self.loop_time,
+            "events": {
+                name: {
+                    "calls": calls,
+                    "handler_time_sec": seconds,
+                    "mean_handler_time_us": seconds / calls * 1e6 if calls else 0.0,
+                }
+                for name, calls, seconds in zip(EVENT_NAMES, self.calls, self.handler_time)
+            },
+            "queue_high_water": self.queue_high_water,
+            "stale_blk_mine_discards": self.stale_mines,
+            "reorgs": sum(self.reorg_depths.values()),
+            "reorg_depths": {str(depth): count for depth, count in sorted(self.reorg_depths.items())},
+            "max_reorg_depth": max(self.reorg_depths, default=0),
+            "orphans_added": sum(pool.added_count for pool in pools),
+            "orphans_evicted": sum(pool.evicted_count for pool in pools),
+            "orphans_pending": sum(len(pool) for pool in pools),
+        }
+
+
+class PhaseTimer:
+    """Class to time the phases of a run, optionally under cProfile
+
+    The profiler is only enabled inside the phases, so the time between them, like
+    printing the metrics, doesn't show up in its output.
+    """
+
+    def __init__(self, use_cprofile=False):
+        self.phases = {}  # name -> seconds, in the order the phases ran
+        self.profiler = cProfile.Profile() if use_cprofile else None
+
+    @contextmanager
+    def phase(self, name):
+        """time the code run in the with block as the given phase"""
+        if self.profiler is not None:
+            self.profiler.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+            if self.profiler is not None:
+                self.profiler.disable()
+
+    def dump_cprofile(self, path):
+        """write the cProfile statistics, readable with pstats or snakeviz, to the given path"""
+        if self.profiler is not None:
+            self.profiler.dump_stats(path)
+
+
+def write_profile(path, phases, stats):
+    """write the phase times and the event loop counters as JSON"""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"phases_sec": phases, "event_loop": stats}, f, indent=2)
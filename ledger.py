@@ -0,0 +1,171 @@
+"""module to keep the balances of every node at each block of the blockchain"""
+
+from collections import OrderedDict
+import numpy as np
+
+
+class Ledger:
+    """Class to cache the balance state at each block
+
+    The balances at a block are its parent's balances plus the coins moved by the
+    block's transactions, so every snapshot is computed once from the nearest cached
+    ancestor. Recently used snapshots are kept in an LRU cache, and a checkpoint is
+    kept for every block whose height is a multiple of checkpoint_interval, so a cache
+    miss never replays more than checkpoint_interval blocks.
+    """
+
+    def __init__(self, num_nodes, block_store, txn_table, cache_size=256, checkpoint_interval=64):
+        self.num_nodes = num_nodes
+        self.block_store = block_store
+        self.txn_table = txn_table
+        self.cache_size = cache_size
+        self.checkpoint_interval = checkpoint_interval
+        self.snapshots = OrderedDict()  # Hash -> balances, least recently used first
+        self.checkpoints = {}  # Hash -> balances
+
+    def balances(self, block_hash):
+        """return the balances of all nodes after the given block, the array must not be modified"""
+        balances = self.lookup(block_hash)
+        if balances is not None:
+            return balances
+
+        # Walk back to the closest ancestor whose balances are known
+        path = []
+        curr_block = block_hash
+        balances = np.zeros(self.num_nodes)
+        while curr_block != -1:
+            cached = self.lookup(curr_block)
+            if cached is not None:
+                balances = cached
+                break
+            path.append(self.block_store[curr_block])
+            curr_block = self.block_store[curr_block].prev_hash
+
+        # Replay the missing blocks, oldest first
+        for block in reversed(path):
+            balances = balances.copy()
+            senders, receivers, amounts = self.txn_table.columns(block.txns)
+            np.add.at(balances, receivers, amounts)
+            # the first transaction is the coinbase, it has no sender
+            np.subtract.at(balances, senders[1:], amounts[1:])
+            self.store(block, balances)
+        return balances
+
+    def lookup(self, block_hash):
+        """return the cached balances of a block, or None"""
+        balances = self.snapshots.get(block_hash)
+        if balances is not None:
+            self.snapshots.move_to_end(block_hash)
+            return balances
+        return self.checkpoints.get(block_hash)
+
+    def store(self, block, balances):
+        """cache the balances of a block"""
+        if block.height % self.checkpoint_interval == 0:
+            self.checkpoints[block.hash] = balances
+            return
+        self.snapshots[block.hash] = balances
+        if len(self.snapshots) > self.cache_size:
+            self.snapshots.popitem(last=False)
+
+
+def balances_before_payments(balances, senders, receivers, amounts, debit=True):
+    """return the balance of the sender of every transaction right before it pays
+
+    Transactions are applied in order, so coins received earlier in the list can be spent
+    by later transactions. Every transaction is split into a debit of its sender followed
+    by a credit of its receiver; a stable sort by node id groups the movements of each
+    node, and a cumulative sum restarted at every group gives the running balance of each
+    node, all in one pass. With debit=False the payments themselves are not subtracted.
+    """
+    count = len(amounts)
+    nodes = np.empty(2 * count, dtype=np.int64)
+    nodes[0::2] = senders
+    nodes[1::2] = receivers
+    flows = np.empty(2 * count)
+    flows[0::2] = -amounts if debit else 0.0
+    flows[1::2] = amounts
+
+    order = np.argsort(nodes, kind="stable")
+    sorted_nodes = nodes[order]
+    sorted_flows = flows[order]
+    running = np.cumsum(sorted_flows)
+    is_start = np.empty(2 * count, dtype=bool)
+    is_start[0] = True
+    np.not_equal(sorted_nodes[1:], sorted_nodes[:-1], out=is_start[1:])
+    group_start = np.flatnonzero(is_start)
+    group = np.cumsum(is_start) - 1
+    running -= (running[group_start] - sorted_flows[group_start])[group]
+
+    balance_after = np.empty(2 * count)
+    balance_after[order] = balances[sorted_nodes] + running
+    return balance_after[0::2] - flows[0::2]
+
+
+def first_overdraft(balances, senders, receivers, amounts):
+    """return the index of the first transaction whose sender can't pay it, or -1 if all can"""
+    if len(amounts) == 0:
+        return -1
+    overdrafts = np.round(balances_before_payments(balances, senders, receivers, amounts), 4) < amounts
+    if not overdrafts.any():
+        return -1
+    return int(np.argmax(overdrafts))
+
+
+def select_transactions(balances, senders, receivers, amounts, limit, max_rounds=8):
+    """return the indices of the transactions an honest miner includes, at most limit of them
+
+    Transactions are taken in order and the ones whose sender can't pay are skipped.
+    Transactions that stay unpayable even if the sender's earlier payments were all skipped
+    are dropped up front. Then each round checks a window of as many transactions as there
+    are free slots with first_overdraft, takes everything before the first overdraft and
+    skips that one. A pool with many double spends would need a round per skipped
+    transaction, so after max_rounds the rest is checked one transaction at a time.
+
+    Nothing depends on the transactions after the last one taken, so callers with a large
+    pool pass a prefix of a couple of times limit and only pass a longer one if the block
+    isn't full, see Node.select_transactions.
+    """
+    if len(amounts) == 0:
+        return np.empty(0, dtype=np.int64)
+    upper_bounds = balances_before_payments(balances, senders, receivers, amounts, debit=False)
+    candidates = np.flatnonzero(np.round(upper_bounds, 4) >= amounts)
+    senders = senders[candidates]
+    receivers = receivers[candidates]
+    amounts = amounts[candidates]
+
+    balances = balances.copy()
+    selected = []
+    taken = 0
+    start = 0
+    count = len(amounts)
+    for _ in range(max_rounds):
+        if start >= count or taken >= limit:
+            break
+        end = min(count, start + limit - taken)
+        failed = first_overdraft(balances, senders[start:end], receivers[start:end], amounts[start:end])
+        stop = end if failed < 0 else start + failed
+        if stop > start:
+            np.subtract.at(balances, senders[start:stop], amounts[start:stop])
+            np.add.at(balances, receivers[start:stop], amounts[start:stop])
+            selected.append(candidates[start:stop])
+            taken += stop - start
+        start = stop if failed < 0 else stop + 1
+    else:
+        balances = balances.tolist()
+        remaining = []
+        for i, sender, receiver, amount in zip(
+            range(start, count), senders[start:].tolist(), receivers[start:].tolist(), amounts[start:].tolist()
+        ):
+            if taken >= limit:
+                break
+            if round(balances[sender], 4) >= amount:
+                balances[sender] -= amount
+                balances[receiver] += amount
+                remaining.append(i)
+                taken += 1
+        selected.append(candidates[remaining])
+
+    if not selected:
+        return np.empty(0, dtype=np.int64)
+    return np.concatenate(selected)
@@ -1,24 +1,134 @@
 """This module is used to initialize the logger for the application."""
+import atexit
 import logging
+import logging.handlers
+import queue
+import sys
 import coloredlogs
 
+LOG_FORMAT = '[%(simulation_time)8.3f] %(levelname)-8s:  %(message)s'
+OVERFLOW_POLICIES = ("drop", "block")
+
 
 class ContextFilter(logging.Filter):
     """
     This is a filter which injects contextual information into the log.
+    The simulation time is read from the clock, any object with a time attribute like the Network, see set_clock.
     """
+    def __init__(self):
+        super().__init__()
+        self.clock = None
+
     def filter(self, record):
-        from network import Network  # Avoid circular import
-        record.simulation_time = round(Network.instance.time if Network.instance else 0.00, 3)
-        record.simulation_time = f'{record.simulation_time:.3f}'
+        clock = self.clock
+        record.simulation_time = clock.time if clock is not None else 0.0
         return True
 
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler for a bounded queue read by a QueueListener thread in the same process.
+    When the queue is full, records are dropped and counted with overflow="drop", or the caller waits
+    for room with overflow="block". Records are queued as they are, the listener formats them.
+    """
+    def __init__(self, record_queue, overflow="drop"):
+        super().__init__(record_queue)
+        self.block = overflow == "block"
+        self.dropped_count = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        if self.block:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped_count += 1
+
+
+class DrainingQueueListener(logging.handlers.QueueListener):
+    """
+    QueueListener that waits for room for its stop sentinel, so it can be stopped while the queue is full.
+    """
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
 log = logging.getLogger('main')
-log.addFilter(ContextFilter())
+context_filter = ContextFilter()
+log.addFilter(context_filter)
+listener = None  # QueueListener of the asynchronous mode, see init_logger
+
+
+def set_clock(clock):
+    """make the log records carry the time of clock, an object with a time attribute"""
+    context_filter.clock = clock
+
+
+def stop_logger():
+    """stop the listener thread of the asynchronous mode, after it wrote the records still queued"""
+    global listener
+    if listener is None:
+        return
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+    dropped = 0
+    for handler in list(log.handlers):
+        if isinstance(handler, BoundedQueueHandler):
+            dropped += handler.dropped_count
+            log.removeHandler(handler)
+    if dropped:
+        print(f"{dropped} log records were dropped because the log queue was full", file=sys.stderr)
+    listener = None
+
+
+def init_logger(level, log_file="", log_file_max_mb=10, log_file_backups=3, async_logging=False, queue_size=10000,
+                overflow="drop"):
+    """initialize logger
+
+    Records go to the console, or to log_file rotated every log_file_max_mb with log_file_backups old files kept.
+    With async_logging the event loop only puts records in a queue of queue_size records, and a background
+    thread writes them; overflow is the policy when the queue is full, "drop" or "block".
+    """
+    global listener
+    if overflow not in OVERFLOW_POLICIES:
+        raise ValueError(f"Unknown log overflow policy '{overflow}', expected one of {', '.join(OVERFLOW_POLICIES)}")
+    stop_logger()
+    for handler in list(log.handlers):
+        log.removeHandler(handler)
+        handler.close()
+
+    if not (log_file or async_logging):
+        coloredlogs.install(fmt=LOG_FORMAT, level=level, logger=log)
+        log.handlers[0].flush()
+        return
+
+    if log_file:
+        handler = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=int(log_file_max_mb * 1024 * 1024), backupCount=log_file_backups, encoding="utf-8"
+        )
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    else:
+        handler = logging.StreamHandler()
+        # colors only on a terminal, piped or redirected stderr gets plain text like the log file
+        if sys.stderr.isatty():
+            handler.setFormatter(coloredlogs.ColoredFormatter(fmt=LOG_FORMAT))
+        else:
+            handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    log.setLevel(level)
+
+    if not async_logging:
+        log.addHandler(handler)
+        return
+
+    record_queue = queue.Queue(maxsize=queue_size)
+    log.addHandler(BoundedQueueHandler(record_queue, overflow))
+    listener = DrainingQueueListener(record_queue, handler)
+    listener.start()
 
 
-def init_logger(level):
-    """initialize logger"""
-    log_format = '[%(simulation_time)8s] %(levelname)-8s:  %(message)s'
-    coloredlogs.install(fmt=log_format, level=level, logger=log)
-    log.handlers[0].flush()
+atexit.register(stop_logger)
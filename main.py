@@ -5,10 +5,14 @@ This script serves as the entry point for the network simulation application. It
 in TOML format, initializes a network simulation using the provided configuration, and performs the simulation.
 
 Usage:
-    python main.py config_file
+    python main.py config_file [--refresh-cache] [--profile] [--cprofile]
 
 Arguments:
     config_file     Path to the configuration file in TOML format.
+    --refresh-cache Run the simulation even if its results are in the result cache, and replace them.
+    --profile       Time the phases of the run and count the events, their handler time, the reorgs and the orphans;
+                    written to profile.json in the output directory. The run is simulated even if it is cached.
+    --cprofile      Like --profile, and also write cProfile statistics of the phases to profile.pstats.
 
 Example:
     python3 main.py config.ini
@@ -23,27 +27,46 @@ Notes:
 - The 'Network' class from the 'network' module is used to represent and simulate the network.
 - The network simulation is prepared, started, and executed using methods of the 'Network' class.
 - After the simulation, a plot of the network and its parameters is created and saved to a file.
+- If a result cache is configured and the run has a seed, a run already in the cache isn't simulated again;
+  its metrics are displayed and its node files copied to the output directory, but no plot is created.
 """
 
 import argparse
 import configparser
+import os
+import shutil
 import art
 
 from network import Network
 from logger import init_logger
+from cache import ResultCache, run_key
+from instrumentation import EventLoopStats, PhaseTimer, write_profile
 
 
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
     parser.add_argument("config_file", type=str, help="Configuration TOML file")
+    parser.add_argument("--refresh-cache", action="store_true", help="Simulate even if the results are cached")
+    parser.add_argument("--profile", action="store_true", help="Write phase times and event loop counters")
+    parser.add_argument("--cprofile", action="store_true", help="Like --profile, with cProfile statistics")
     args = parser.parse_args()
+    profiling = args.profile or args.cprofile
 
     config = configparser.ConfigParser()
     config.read(args.config_file)
 
-    LOG_LEVEL = "DEBUG" if config["simulation"]["debug"] == "True" else "INFO"
-    init_logger(LOG_LEVEL)
+    simulation = config["simulation"]
+    LOG_LEVEL = "DEBUG" if simulation["debug"] == "True" else "INFO"
+    init_logger(
+        LOG_LEVEL,
+        log_file=simulation.get("log_file", ""),
+        log_file_max_mb=float(simulation.get("log_file_max_mb", 10)),
+        log_file_backups=int(simulation.get("log_file_backups", 3)),
+        async_logging=simulation.get("log_async", "False") == "True",
+        queue_size=int(simulation.get("log_queue_size", 10000)),
+        overflow=simulation.get("log_overflow", "drop"),
+    )
 
     art.tprint('P2P Cryptocurrency\nNetwork Simulation', font='BifFig')
     print('Welcome to the project!')
@@ -51,11 +74,45 @@ if __name__ == "__main__":
 
     network = Network(config, type="toml")
     network.show_parameters()
-    network.prepare_simulation()
-    network.display_network()
-    network.start_simulation() # main simulation
-    network.display_info()
-    network.create_plot()
-    network.dump_to_file()
+
+    cache, key, cached = None, None, None
+    if network.result_cache and network.seed is not None:
+        cache = ResultCache(network.result_cache, int(network.result_cache_max_mb * 1024 * 1024))
+        key = run_key(config, network.seed)
+        cached = None if args.refresh_cache or profiling else cache.get(key)
+        if cached is not None and len(cached[1]) != network.total_nodes:
+            cached = None  # stored by sweep.py, without the node files
+    elif network.result_cache:
+        print("No seed in the configuration, the results won't be cached\n")
+
+    if cached is not None:
+        metrics, files = cached
+        print(f"Results found in the cache ({key[:12]}), skipping the simulation\n")
+        os.makedirs(network.output_path(), exist_ok=True)
+        for name, path in files.items():
+            shutil.copy(path, os.path.join(network.output_path(), name))
+        Network.display_metrics(metrics)
+    else:
+        timer = PhaseTimer(use_cprofile=args.cprofile)
+        stats = EventLoopStats() if profiling else None
+        with timer.phase("prepare_simulation"):
+            network.prepare_simulation()
+        network.display_network()
+        with timer.phase("start_simulation"):
+            network.start_simulation(stats) # main simulation
+        metrics = network.collect_metrics()
+        Network.display_metrics(metrics)
+        with timer.phase("create_plot"):
+            network.create_plot()
+        with timer.phase("dump_to_file"):
+            file_paths = network.dump_to_file()
+        if cache is not None:
+            cache.put(key, metrics, file_paths)
+        if profiling:
+            profile_path = os.path.join(network.output_path(), "profile.json")
+            write_profile(profile_path, timer.phases, stats.report(network))
+            print(f"Profile written to {profile_path}")
+            if args.cprofile:
+                timer.dump_cprofile(os.path.join(network.output_path(), "profile.pstats"))
 
     print("Simulation completed successfully :)")
@@ -0,0 +1,101 @@
+"""module to keep the pending transactions of a node ordered by timestamp"""
+
+import heapq
+from itertools import count
+import numpy as np
+
+
+class Mempool:
+    """Class to represent the pool of transactions waiting to be included in a block
+
+    Transactions are given by their id in the TransactionTable and kept in a binary
+    heap of (timestamp, seq, id) entries, so adding one costs O(log n). Removing one
+    only drops it from the index; its heap entry is skipped from then on and the heap
+    is rebuilt once such stale entries outnumber the live ones. ids() returns the pool,
+    or only its first transactions, in timestamp order; transactions with the same
+    timestamp come out in the order they were added.
+    """
+
+    def __init__(self):
+        self.entries = {}  # id -> (seq, timestamp)
+        self.heap = []  # (timestamp, seq, id)
+        self.counter = count()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, txn_id):
+        return txn_id in self.entries
+
+    def ids(self, count=None):
+        """return the ids of the first count transactions in timestamp order as an array, all of them if count is None"""
+        entries = self.entries
+        heap = self.heap
+        if count is None or count >= len(entries):
+            if len(heap) > len(entries):
+                self.compact()
+                heap = self.heap
+            # a sorted list is still a valid heap, and sorting it again after a few pushes is cheap
+            heap.sort()
+            return np.fromiter((entry[2] for entry in heap), dtype=np.int64, count=len(heap))
+
+        # Walk the heap from the root, every entry is smaller than its children, so the live
+        # entries come out in order and reading a prefix costs O(count log count), not O(n)
+        size = len(heap)
+        heappush = heapq.heappush
+        heappop = heapq.heappop
+        ids = []
+        frontier = [(heap[0], 0)]
+        while len(ids) < count:
+            entry, index = heappop(frontier)
+            live = entries.get(entry[2])
+            if live is not None and live[0] == entry[1]:
+                ids.append(entry[2])
+            child = 2 * index + 1
+            if child < size:
+                heappush(frontier, (heap[child], child))
+                if child + 1 < size:
+                    heappush(frontier, (heap[child + 1], child + 1))
+        return np.array(ids, dtype=np.int64)
+
+    def add(self, txn_id, timestamp):
+        """add a transaction, does nothing if it is already in the pool"""
+        if txn_id in self.entries:
+            return
+        seq = next(self.counter)
+        self.entries[txn_id] = (seq, timestamp)
+        heapq.heappush(self.heap, (timestamp, seq, txn_id))
+
+    def restore(self, txn_ids, timestamps):
+        """add back the transactions of blocks that are no longer on the longest chain"""
+        new_entries = []
+        for txn_id, timestamp in zip(txn_ids, timestamps):
+            if txn_id in self.entries:
+                continue
+            seq = next(self.counter)
+            self.entries[txn_id] = (seq, timestamp)
+            new_entries.append((timestamp, seq, txn_id))
+
+        if len(new_entries) > len(self.heap):
+            self.heap.extend(new_entries)
+            heapq.heapify(self.heap)
+        else:
+            for entry in new_entries:
+                heapq.heappush(self.heap, entry)
+
+    def discard(self, txn_id):
+        """remove a transaction if it is in the pool"""
+        if self.entries.pop(txn_id, None) is None:
+            return
+        if len(self.heap) > 2 * len(self.entries) + 1024:
+            self.compact()
+
+    def discard_many(self, txn_ids):
+        """remove the given transactions that are in the pool"""
+        for txn_id in txn_ids:
+            self.discard(txn_id)
+
+    def compact(self):
+        """rebuild the heap without the entries of removed transactions"""
+        self.heap = [(timestamp, seq, txn_id) for txn_id, (seq, timestamp) in self.entries.items()]
+        heapq.heapify(self.heap)
@@ -1,35 +1,44 @@
 """"class to handle functions related to network and simulating the blockchain"""
 
-import random
+import math
 import os
 import time
-from collections import deque
 import numpy as np
 from graphviz import Digraph
 
-from events import EventQueue
+from events import make_event_queue
 from node import Node
 from node_adversary import AdversaryNode
-from block import Block
-from logger import log
+from block import Block, BlockStore
+from ledger import Ledger
+from transaction import TransactionTable
+from rng import RandomStream, buffer_size_for
+from topology import load_or_create_topology
+from logger import log, set_clock
 
 
 class Network:
     """Network class to execute simlation using a discrete-events"""
 
-    instance = None  # used to include time in log statements
-
     def __init__(self, config, type):
         """member to initialize attributes of network"""
-        Network.instance = self  # used to include time in log statements
+        set_clock(self)  # used to include time in log statements
 
         self.nodes = []
-        self.neighbor_constraint = False
-        self.connected_graph = False
         self.num_slow_nodes = 0
         self.num_low_cpu_nodes = 0
         self.time = 0.0
         self.event_queue = None
+        # Topology in CSR form with per-link parameters, see freeze_topology
+        self.neighbor_offsets = None
+        self.neighbor_ids = None
+        self.link_speed = None
+        self.link_prop_delay = None
+        self.link_transmission_per_kb = None
+        self.link_queueing_mean = None
+        self.txn_table = TransactionTable()  # every transaction of the simulation
+        self.block_store = BlockStore()  # every block of the simulation
+        self.ledger = None
 
         if type == "toml":
             # simulation
@@ -39,12 +48,26 @@ class Network:
             self.percent_low_cpu_nodes = float(config["simulation"]["percent_low_cpu_nodes"])
             self.output_dir = config["simulation"]["output_dir"]
             self.dark_mode = config["simulation"]["dark_mode"]
+            self.event_queue_backend = config["simulation"].get("event_queue", "heap")
+            seed = config["simulation"].get("seed", "")
+            self.seed = int(seed) if seed else None
+            self.result_cache = config["simulation"].get("result_cache", "")
+            self.result_cache_max_mb = float(config["simulation"].get("result_cache_max_mb", 1024))
+            rng_buffer_size = config["simulation"].get("rng_buffer_size", "")
+            self.rng_buffer_size = int(rng_buffer_size) if rng_buffer_size else None
 
             # node
             self.min_neighbors = int(config["node"]["min_neighbors"])
             self.max_neighbors = int(config["node"]["max_neighbors"])
             self.adversary_one_mining_power = float(config["node"]["adversary_one_mining_power"])
             self.adversary_two_mining_power = float(config["node"]["adversary_two_mining_power"])
+            self.max_orphan_blocks = int(config["node"].get("max_orphan_blocks", 256))
+            self.seen_set_kind = config["node"].get("seen_set", "exact")
+            self.seen_set_fp_rate = float(config["node"].get("seen_set_fp_rate", 0.001))
+            seen_set_capacity = config["node"].get("seen_set_capacity", "")
+            self.seen_set_capacity = int(seen_set_capacity) if seen_set_capacity else None
+            self.seen_set_rotation_sec = float(config["node"].get("seen_set_rotation_sec", 600))
+            self.seen_set_audit = config["node"].get("seen_set_audit", "False") == "True"
 
             # transaction
             self.transaction_size = int(config["transaction"]["size"])
@@ -56,6 +79,13 @@ class Network:
             self.slow_node_link_speed = float(config["network"]["slow_node_link_speed"])
             self.fast_node_link_speed = float(config["network"]["fast_node_link_speed"])
             self.queuing_delay_constant = int(config["network"]["queuing_delay_constant"])
+            topology_seed = config["network"].get("topology_seed", "")
+            self.topology_seed = int(topology_seed) if topology_seed else self.seed
+            self.topology_cache = config["network"].get("topology_cache", "")
+            self.relay_mode = config["network"].get("relay_mode", "immediate")
+            self.relay_interval = float(config["network"].get("relay_interval", 1.0))
+            if self.relay_mode not in ("immediate", "batched"):
+                raise ValueError(f"Unknown relay mode '{self.relay_mode}', expected 'immediate' or 'batched'")
 
             # mining
             self.mean_mining_time_sec = int(config["mining"]["mean_mining_time_sec"])
@@ -66,7 +96,15 @@ class Network:
             print("Unknown config type")
 
         # derived
-        self.prop_delay = random.uniform(self.min_light_prop_delay, self.max_light_prop_delay)
+        if self.seen_set_capacity is None:
+            # every node creates a transaction every mean_interarrival_time_sec and each node sees them all
+            expected_txns = self.total_nodes / self.mean_interarrival_time_sec * self.seen_set_rotation_sec
+            self.seen_set_capacity = max(1, math.ceil(expected_txns))
+        if self.rng_buffer_size is None:
+            # every node draws from three streams spawned from the root one
+            self.rng_buffer_size = buffer_size_for(3 * self.total_nodes + 1)
+        self.rng = RandomStream.from_seed(self.seed, self.rng_buffer_size)  # root stream, every node spawns its own from it
+        self.prop_delay = self.rng.uniform(self.min_light_prop_delay, self.max_light_prop_delay)
 
     def show_parameters(self):
         """method to display parameters of network"""
@@ -77,10 +115,21 @@ class Network:
         print(f" -- Low cpu nodes percent: {self.percent_low_cpu_nodes}")
         print(f" -- Output directory: {self.output_dir}")
         print(f" -- Dark Mode: {self.dark_mode}")
+        print(f" -- Event queue: {self.event_queue_backend}")
+        print(f" -- Random seed: {self.seed if self.seed is not None else 'random'}")
+        print(f" -- Result cache: {self.result_cache or 'none'}")
+        print(f" -- Random number buffer size: {self.rng_buffer_size}")
         print(f" -- Min neighbors: {self.min_neighbors}")
         print(f" -- Max neighbors: {self.max_neighbors}")
         print(f" -- Adversary one mining power: {self.adversary_one_mining_power}")
         print(f" -- Adversary two mining power: {self.adversary_two_mining_power}")
+        print(f" -- Max orphan blocks per node: {self.max_orphan_blocks}")
+        print(f" -- Seen transactions set: {self.seen_set_kind}")
+        if self.seen_set_kind == "bloom":
+            print(f" -- Seen set false positive rate: {self.seen_set_fp_rate}")
+            print(f" -- Seen set capacity: {self.seen_set_capacity}")
+            print(f" -- Seen set rotation time: {self.seen_set_rotation_sec}")
+            print(f" -- Seen set audit: {self.seen_set_audit}")
         print(f" -- Transaction size: {self.transaction_size}")
         print(f" -- Mean interarrival time: {self.mean_interarrival_time_sec}")
         print(f" -- Min light prop delay: {self.min_light_prop_delay}")
@@ -88,6 +137,11 @@ class Network:
         print(f" -- Slow node link speed: {self.slow_node_link_speed}")
         print(f" -- Fast node link speed: {self.fast_node_link_speed}")
         print(f" -- Queuing delay constant: {self.queuing_delay_constant}")
+        print(f" -- Topology seed: {self.topology_seed if self.topology_seed is not None else 'random'}")
+        print(f" -- Topology cache: {self.topology_cache or 'none'}")
+        print(f" -- Transaction relay: {self.relay_mode}")
+        if self.relay_mode == "batched":
+            print(f" -- Relay interval: {self.relay_interval}")
         print(f" -- Mean mining time: {self.mean_mining_time_sec}")
         print(f" -- Mining reward: {self.mining_reward}")
         print(f" -- Max txns in block: {self.max_txn_in_block}")
@@ -97,9 +151,10 @@ class Network:
     def prepare_simulation(self):
         """method to create P2P network"""
         self.create_nodes()
-        self.create_network_topology()
+        offsets, neighbor_ids = self.create_network_topology()
+        self.freeze_topology(offsets, neighbor_ids)
         self.set_hashing_power()
-        self.event_queue = EventQueue()
+        self.event_queue = make_event_queue(self.event_queue_backend)
         self.time = 0
 
     def create_nodes(self):
@@ -108,10 +163,12 @@ class Network:
         print("Creating nodes...")
         # Create coinbase transactions to initialize balances
         genesis_transactions = []
-        genesis = Block(self.time, -1, 0, genesis_transactions)
+        genesis = Block(self.time, -1, 0, genesis_transactions, self.txn_table)
+        self.block_store.add(genesis)
+        self.ledger = Ledger(self.total_nodes, self.block_store, self.txn_table)
         for i in range(self.total_nodes - 2):
-            speed_threshold = np.random.uniform(0, 1)
-            cpu_threshold = np.random.uniform(0, 1)
+            speed_threshold = self.rng.uniform(0, 1)
+            cpu_threshold = self.rng.uniform(0, 1)
             is_slow = speed_threshold <= (self.percent_slow_nodes / 100.0)
             is_low_cpu = cpu_threshold <= (self.percent_low_cpu_nodes / 100.0)
 
@@ -131,64 +188,42 @@ class Network:
         self.nodes.append(node)
 
     def create_network_topology(self):
-        """method to build connections between nodes"""
+        """method to build connections between nodes, returns the topology as CSR arrays (offsets, neighbor ids)"""
 
         print("Building network...")
-        while not (self.connected_graph and self.neighbor_constraint):
-            self.reset_network()
-
-            for node in self.nodes:
-                self.build_neighbors(node)
-
-            if not self.neighbor_constraint:
-                log.warning("Not every node has 3-6 neighbors, rebuilding...")
-                continue
-
-            self.connected_graph = self.is_connected_graph()
-            if not self.connected_graph:
-                log.warning("Network topology not connected, rebuilding...")
-
+        offsets, neighbor_ids = load_or_create_topology(
+            self.total_nodes,
+            self.min_neighbors,
+            self.max_neighbors,
+            seed=self.topology_seed,
+            cache_dir=self.topology_cache,
+            rng=self.rng.spawn(),
+        )
         print("Network created successfully")
+        return offsets, neighbor_ids
+
+    def freeze_topology(self, offsets, neighbor_ids):
+        """method to store the connections as CSR arrays, with the parameters of every link
+
+        The neighbors of node i are neighbor_ids[neighbor_offsets[i]:neighbor_offsets[i + 1]],
+        and the link arrays hold the values of each of these directed edges at the same position.
+        """
+        self.neighbor_offsets = offsets
+        self.neighbor_ids = neighbor_ids
+        degrees = np.diff(offsets)
+
+        # A link is slow if either of its ends is a slow node
+        is_slow = np.array([node.is_slow for node in self.nodes])
+        senders = np.repeat(np.arange(len(self.nodes)), degrees)
+        slow_link = is_slow[senders] | is_slow[self.neighbor_ids]
+        link_speed = np.where(slow_link, self.slow_node_link_speed, self.fast_node_link_speed)  # in Mbps
+        self.link_speed = link_speed
+        self.link_prop_delay = np.full(len(self.neighbor_ids), self.prop_delay)
+        self.link_transmission_per_kb = 8 / (link_speed * 1024)
+        self.link_queueing_mean = float(self.queuing_delay_constant) / (link_speed * 1024)
 
-    def reset_network(self):
-        """method to delete network connections"""
         for node in self.nodes:
-            node.neighbors.clear()
-        self.neighbor_constraint = False
-        self.connected_graph = False
-
-    def build_neighbors(self, node):
-        """method to create neighbors of a node"""
-
-        num_neighbors = random.randint(self.min_neighbors, self.max_neighbors)
-        available_nodes = [
-            p for p in self.nodes if p != node and len(p.neighbors) < self.max_neighbors and p not in node.neighbors
-        ]
-        random.shuffle(available_nodes)
-
-        for _ in range(num_neighbors - len(node.neighbors)):
-            if available_nodes:
-                neighbor = available_nodes.pop()
-                # print(f"{neighbor.id} added as neighbor of {node.id}")
-                node.add_neighbor(neighbor.id)
-                neighbor.add_neighbor(node.id)
-            else:
-                return
-
-        self.neighbor_constraint = True
-
-    def is_connected_graph(self):
-        """method to check if network is connected"""
-        visited = set()
-        queue = deque([self.nodes[0].id])
-        while queue:
-            current_node_id = queue.popleft()
-            current_node = self.nodes[current_node_id]
-            visited.add(current_node_id)
-            for neighbor in current_node.get_neighbors():
-                if neighbor not in visited:
-                    queue.append(neighbor)
-        return len(visited) == len(self.nodes)
+            node.set_links(self.neighbor_offsets[node.id], self.neighbor_offsets[node.id + 1])
 
     def set_hashing_power(self):
         """ "method to set hashing power of nodes"""
@@ -220,8 +255,8 @@ class Network:
             )
         print()
 
-    def start_simulation(self):
-        """method to start simulation"""
+    def start_simulation(self, stats=None):
+        """method to start simulation, the events are run by stats if an instrumentation.EventLoopStats is given"""
 
         print(f" -- Genesis block: {self.nodes[0].genesis_block.hash}\n")
 
@@ -231,44 +266,47 @@ class Network:
             node.transaction_create()
             node.block_create()
 
+        if stats is not None:
+            stats.run(self)
+        else:
+            self.run_events()
+
+        end_time = time.time()
+        print(f"\nSimulation time: {round(end_time - start_time, 3)} seconds")
+
+    def run_events(self):
+        """method to run the events until the queue is empty or the execution time is up"""
+        event_queue = self.event_queue
+        handlers = [node.handlers for node in self.nodes]  # node id -> dispatch table
         while True:
-            if not self.event_queue.queue.empty():
-                event = self.event_queue.pop()
+            if event_queue:
+                event = event_queue.pop()
             else:
                 log.info("No more events in event queue. Exiting Simulation.")
                 break
 
             # Update current time
             self.time = event.time
-            receiver = self.nodes[event.receiver_id]
 
             if event.time > self.execution_time:
                 log.info("Simulation time is up. Exiting Simulation.")
                 break
 
-            if event.type == "txn_create":
-                # log.debug(str(event))
-                receiver.transaction_create_handler(event.time)
-            elif event.type == "txn_recv":
-                # log.debug(str(event))
-                receiver.transaction_receive_handler(event.data, event.sender_id)
-            elif event.type == "blk_mine":
-                # log.debug(str(event))
-                receiver.block_mine_handler(event.data)
-            elif event.type == "blk_recv":
-                # log.debug(str(event))
-                receiver.block_receive_handler(event.data, event.sender_id)
-            else:
-                log.warning("Unknown event type")
-                break
-
-        end_time = time.time()
-        print(f"\nSimulation time: {round(end_time - start_time, 3)} seconds")
-
-    def display_info(self):
-        """display info about the simulation"""
-        print("Events currently in event queue: ", self.event_queue.queue.qsize())
-        print()
+            handlers[event.receiver_id][event.type](event.data, event.sender_id)
+
+    def collect_metrics(self):
+        """method to return the results of the simulation as a dictionary"""
+        seen_sets = [node.txn_registry for node in self.nodes]
+        metrics = {
+            "events_pending": len(self.event_queue),
+            "events_executed": self.event_queue.executed_count,
+            "events_cancelled": self.event_queue.cancelled_count,
+            "seen_set_memory_bytes": sum(seen.memory_bytes() for seen in seen_sets),
+            "seen_set_fp_rate": max(seen.estimated_fp_rate() for seen in seen_sets),
+            "seen_set_false_positives": None,
+        }
+        if self.seen_set_kind == "exact" or self.seen_set_audit:
+            metrics["seen_set_false_positives"] = sum(seen.false_positives for seen in seen_sets)
 
         adversary_node_ids = []
         for node in self.nodes:
@@ -277,26 +315,21 @@ class Network:
 
         all_blocks = set()
         for node in self.nodes:
-            all_blocks = all_blocks.union(set(node.block_registry.keys()))
-        print(f"Total number of blocks mined by all nodes: {len(all_blocks)}")
+            all_blocks.update(node.known_blocks)
+        metrics["total_blocks"] = len(all_blocks)
         for block_hash in self.nodes[adversary_node_ids[0]].private_chain:
             all_blocks.remove(block_hash)
         for block_hash in self.nodes[adversary_node_ids[1]].private_chain:
             all_blocks.remove(block_hash)
-        print(f"Total number of blocks mined by all nodes excluding private chains: {len(all_blocks)}")
+        metrics["total_public_blocks"] = len(all_blocks)
 
         lvc_leaf_hash = self.nodes[0].longest_leaf_hash
-        lvc_block = self.nodes[0].block_registry[lvc_leaf_hash]
+        lvc_block = self.block_store[lvc_leaf_hash]
         lvc_leaf_height = lvc_block.height
-        print("Number of blocks in longest chain of honest nodes: ", lvc_leaf_height)
-
-        # for node in self.nodes:
-        # print(f" node {node.id} has blocks: {list(node.block_registry.keys())}")
-        # print(f"Node {node.id} has longest chain at height: {node.block_registry[node.longest_leaf_hash].height}, hash {node.longest_leaf_hash[:7]}"
-        print()
-        # print("Ratio of mined blocks included in longest chain to total mined blocks by the node:")
-        print(" -- MPU_adversary_nodes --")
+        metrics["longest_chain_length"] = lvc_leaf_height
 
+        # Ratio of mined blocks included in longest chain to total mined blocks by the node
+        metrics["mpu_adversary_nodes"] = []
         for node in self.nodes:
             if node.id not in adversary_node_ids:
                 continue
@@ -304,33 +337,63 @@ class Network:
                 node.longest_leaf_hash = node.l_v_c_hash
             accepted_self_mined_blocks = 0
             total_mined_blocks = 0
-            for block in node.block_registry.values():
-                if len(block.txns) == 0:
+            for block in (self.block_store[block_hash] for block_hash in node.known_blocks):
+                if len(block.txns) == 0 or self.txn_table.receiver[block.txns[0]] != node.id:
                     continue
-                if block.txns[0].receiver_id == node.id and block.hash not in node.private_chain:
+                if block.hash not in node.private_chain:
                     total_mined_blocks += 1
-
-            # curr_block_hash = node.longest_leaf_hash
-            curr_block_hash = lvc_leaf_hash
-            while curr_block_hash != -1:
-                curr_block = self.nodes[0].block_registry[curr_block_hash]
-                if len(curr_block.txns) == 0:
-                    break
-                if curr_block.txns[0].receiver_id == node.id:
+                # the block is on the longest chain if it is the chain's ancestor at its height
+                if block.height <= lvc_leaf_height and self.block_store.ancestor(lvc_leaf_hash, block.height) == block.hash:
                     accepted_self_mined_blocks += 1
-                curr_block_hash = self.nodes[0].block_registry[curr_block_hash].prev_hash
             ratio = round(
                 accepted_self_mined_blocks / total_mined_blocks if total_mined_blocks != 0 else float("inf"), 4
             )
-            cpu_type = "low-cpu" if node.is_low_cpu else "high-cpu"
-            node_type = "slow" if node.is_slow else "fast"
+            metrics["mpu_adversary_nodes"].append(
+                {
+                    "node_id": node.id,
+                    "is_low_cpu": node.is_low_cpu,
+                    "is_slow": node.is_slow,
+                    "accepted_blocks": accepted_self_mined_blocks,
+                    "mined_blocks": total_mined_blocks,
+                    "mpu": ratio,
+                }
+            )
+        metrics["mpu_overall"] = round(lvc_leaf_height / len(all_blocks), 4)
+        return metrics
+
+    def display_info(self):
+        """display info about the simulation"""
+        self.display_metrics(self.collect_metrics())
+
+    @staticmethod
+    def display_metrics(metrics):
+        """display the results of a simulation, as returned by collect_metrics"""
+        print("Events currently in event queue: ", metrics["events_pending"])
+        print("Events executed: ", metrics["events_executed"])
+        print("Events cancelled: ", metrics["events_cancelled"])
+        print("Memory used by seen transaction sets (bytes): ", metrics["seen_set_memory_bytes"])
+        print("Seen set estimated false positive rate (max): ", round(metrics["seen_set_fp_rate"], 6))
+        if metrics["seen_set_false_positives"] is not None:
+            print("Seen set false positives: ", metrics["seen_set_false_positives"])
+        print()
+
+        print(f"Total number of blocks mined by all nodes: {metrics['total_blocks']}")
+        print(f"Total number of blocks mined by all nodes excluding private chains: {metrics['total_public_blocks']}")
+        print("Number of blocks in longest chain of honest nodes: ", metrics["longest_chain_length"])
+        print()
+
+        print(" -- MPU_adversary_nodes --")
+        for adversary in metrics["mpu_adversary_nodes"]:
+            cpu_type = "low-cpu" if adversary["is_low_cpu"] else "high-cpu"
+            node_type = "slow" if adversary["is_slow"] else "fast"
             print(
-                f"Node {node.id} ({cpu_type}, {node_type}):  {accepted_self_mined_blocks} / {total_mined_blocks} = {ratio}"
+                f"Node {adversary['node_id']} ({cpu_type}, {node_type}):  "
+                f"{adversary['accepted_blocks']} / {adversary['mined_blocks']} = {adversary['mpu']}"
             )
         print()
 
         print(" -- MPU_overall -- ")
-        print(f"{lvc_leaf_height} / {len(all_blocks)} = {round(lvc_leaf_height / len(all_blocks), 4)}")
+        print(f"{metrics['longest_chain_length']} / {metrics['total_public_blocks']} = {metrics['mpu_overall']}")
         print()
 
     def create_plot(self):
@@ -371,11 +434,11 @@ class Network:
                         labeljust="l",
                         label=f'< <FONT POINT-SIZE="20" COLOR="{colors["nodelabel"]}"><B>Node {node.id}{adversary_label}</B></FONT> >',
                     )
-                    for block in node.block_registry.values():
-                        miner = block.txns[0].receiver_id if block.txns else "Satoshi"
+                    for block in (self.block_store[block_hash] for block_hash in node.known_blocks):
+                        miner = int(self.txn_table.receiver[block.txns[0]]) if len(block.txns) else "Satoshi"
                         private = "PVT: " if node.id in adversary_node_ids and block.hash in node.private_chain else ""
                         label = f"{private}{block.hash_s} | MineTime= {round(block.mine_time, 2)} | {{ Height={block.height} | Miner = {miner} }} | IncludedTxns={len(block.txns)}"
-                        label = f"{label} | ReleaseTime= {round(block.release_time, 2)}" if miner in adversary_node_ids else label
+                        label = f"{label} | ReleaseTime= {round(self.nodes[miner].release_times.get(block.hash, 0.0), 2)}" if miner in adversary_node_ids else label
                         fillcolor = colors["block_adv_one"] if miner == adversary_node_ids[0] else colors["block_default"]
                         fillcolor = colors["block_adv_two"] if miner == adversary_node_ids[1] else fillcolor
                         c.node(f"{node.id}-{block.hash}", label=label, _attributes={"fillcolor": fillcolor, "fontcolor": colors["block_text"], "color": colors["edge"]})
@@ -384,15 +447,23 @@ class Network:
 
         d.view(directory=self.output_dir)
 
+    def output_path(self):
+        """return the directory the output files are written to"""
+        return os.path.join(os.path.dirname(__file__), self.output_dir)
+
     def dump_to_file(self):
-        """dump all the blocks of each node to a separate file"""
+        """dump all the blocks of each node to a separate file, return the paths of the files"""
 
         print("Dumping blocks of each node to a separate file...")
-        path = os.path.join(os.path.dirname(__file__), self.output_dir)
+        path = self.output_path()
         if not os.path.exists(path):
             os.makedirs(path)
+        file_paths = []
         for node in self.nodes:
-            with open(f"{path}/node_{node.id}.csv", "w", encoding="utf-8") as f:
+            file_path = f"{path}/node_{node.id}.csv"
+            with open(file_path, "w", encoding="utf-8") as f:
                 f.write("block_hash,height,mine_time,included_transactions,prev_hash\n")
-                for block in node.block_registry.values():
+                for block in (self.block_store[block_hash] for block_hash in node.known_blocks):
                     f.write(f"{block.__str_v2__()}\n")
+            file_paths.append(file_path)
+        return file_paths
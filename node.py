@@ -1,12 +1,15 @@
 """"class to handle functions related to node"""
 
-import random
-from copy import deepcopy
+from collections import deque
+import logging
 import numpy as np
 
-from transaction import Transaction
-from events import Event
+from events import Event, TXN_CREATE, TXN_RECV, BLK_MINE, BLK_RECV, TXN_FLUSH, TXN_BATCH_RECV
 from block import Block
+from orphan_pool import OrphanPool
+from mempool import Mempool
+from seen_set import make_seen_set
+from ledger import first_overdraft, select_transactions
 from logger import log
 
 
@@ -19,61 +22,107 @@ class Node:
         self.is_slow = is_slow
         self.is_low_cpu = is_low_cpu
         self.is_adversary = False  # if the node is an adversary (selfish miner)
-        self.neighbors = set()  # Set of nodes that are connected to this node
-        self.txn_pool = {}  # uuid -> txn, Dict of transactions that have to be processed
-        self.txn_registry = set()  # Set of ids of all the transactions seen
-        self.pending_blocks = set()  # Set of blocks whose previous block hasn't arrived
+        # Links to the neighbors, set from the network's CSR arrays once the topology is frozen
+        self.neighbor_list = []  # ids of the neighbors, in the order of the links
+        self.links = []  # (propagation delay, transmission delay per KB, mean queueing delay) per neighbor
+        self.link_index = {}  # neighbor id -> position in neighbor_list and links
+        # Batched relay, transactions are buffered and sent to the neighbors every relay_interval seconds
+        self.batched_relay = network.relay_mode == "batched"
+        self.relay_buffer = []  # (txn id, id of the node it came from) to send at the next flush
+        self.flush_scheduled = False
+        self.txn_pool = Mempool()  # transactions that have to be processed, ordered by timestamp
+        self.txn_registry = make_seen_set(  # ids of all the transactions seen
+            network.seen_set_kind,
+            network.seen_set_fp_rate,
+            network.seen_set_capacity,
+            network.seen_set_rotation_sec,
+            network.seen_set_audit,
+        )
+        self.pending_blocks = OrphanPool(network.max_orphan_blocks)  # blocks whose previous block hasn't arrived
+        self.orphans_to_process = deque()  # orphans whose parent arrived, see process_pending_blocks
+        self.processing_orphans = False
 
         self.hashing_power = 0
+        # separate streams, so e.g. a change to the delay model leaves the mining times as they were
+        self.delay_rng = network.rng.spawn()
+        self.mining_rng = network.rng.spawn()
+        self.txn_rng = network.rng.spawn()
         self.network = network
         self.block_hash_being_mined = None
-        self.genesis_block = deepcopy(genesis)
+        self.mining_event = None  # pending blk_mine event, cancelled when mining restarts
+        self.genesis_block = genesis
 
         # Hash of Leaf Block of the Longest Branch in blockchain. We'll always mine on this chain
         self.longest_leaf_hash = self.genesis_block.hash
-        self.block_registry = {self.genesis_block.hash: self.genesis_block}  # Hash -> Block
+        self.blocks = network.block_store  # Hash -> Block, every block of the network, shared between nodes
+        self.known_blocks = {self.genesis_block.hash: 0.0}  # Hash -> time at which this node got the block
+        self.ledger = network.ledger  # balances at each block, shared between nodes
+        self.coinbase_txn = None  # id of the coinbase transaction of the blocks being mined
+        # log levels checked once, so the handlers don't build the arguments of disabled log calls
+        self.log_debug = log.isEnabledFor(logging.DEBUG)
+        self.log_info = log.isEnabledFor(logging.INFO)
+
+        # Dispatch table indexed by event kind, every handler takes (data, source_node_id)
+        self.handlers = (
+            self.transaction_create_handler,
+            self.transaction_receive_handler,
+            self.block_mine_handler,
+            self.block_receive_handler,
+            self.transaction_flush_handler,
+            self.transaction_batch_receive_handler,
+        )
 
     def __str__(self):
         return f"{self.id}"
 
-    def add_neighbor(self, neighbor):
-        """method to add a neighbor to the node's neighbor list"""
-        self.neighbors.add(neighbor)
-
-    def remove_neighbor(self, neighbor):
-        """method to remove a neighbor from the node's neighbor list"""
-        if neighbor in self.neighbors:
-            self.neighbors.remove(neighbor)
-
     def get_neighbors(self):
         """method to return the list of neighbors of the node"""
-        return list(self.neighbors)
+        return list(self.neighbor_list)
+
+    def set_links(self, start, end):
+        """method to take the links of the node from rows start to end of the network's frozen topology"""
+        network = self.network
+        self.neighbor_list = network.neighbor_ids[start:end].tolist()
+        self.links = list(
+            zip(
+                network.link_prop_delay[start:end].tolist(),
+                network.link_transmission_per_kb[start:end].tolist(),
+                network.link_queueing_mean[start:end].tolist(),
+            )
+        )
+        self.link_index = {node_id: i for i, node_id in enumerate(self.neighbor_list)}
 
     def compute_delay(self, msg_size, receiver_id):
         """ "method to compute delay for sending messages"""
-        if self.is_slow or self.network.nodes[receiver_id].is_slow:
-            link_speed = self.network.slow_node_link_speed
-        else:
-            link_speed = self.network.fast_node_link_speed
-
-        transmission_delay = (msg_size * 8) / (link_speed * 1024)
-        queueing_delay = np.random.exponential((float(self.network.queuing_delay_constant)) / (link_speed * 1024))
-
-        return self.network.prop_delay + transmission_delay + queueing_delay
+        prop_delay, transmission_per_kb, queueing_mean = self.links[self.link_index[receiver_id]]
+        return prop_delay + msg_size * transmission_per_kb + self.delay_rng.exponential(queueing_mean)
+
+    def broadcast_links(self, msg_size, source_node_id=None):
+        """method to return the (neighbor id, delay) pairs for sending a message to every neighbor but its source"""
+        exponential = self.delay_rng.exponential
+        delays = [
+            prop_delay + msg_size * transmission_per_kb + exponential(queueing_mean)
+            for prop_delay, transmission_per_kb, queueing_mean in self.links
+        ]
+        # dont send back to the node from which the message came
+        if source_node_id:
+            return [(node_id, delay) for node_id, delay in zip(self.neighbor_list, delays) if node_id != source_node_id]
+        return list(zip(self.neighbor_list, delays))
 
     def transaction_create(self):
         """method to add an txn_create event in the FUTURE"""
-        event_timestamp = self.network.time + np.random.exponential(self.network.mean_interarrival_time_sec)
-        self.network.event_queue.push(Event(event_timestamp, self.id, self.id, "txn_create", data=None))
+        event_timestamp = self.network.time + self.txn_rng.exponential(self.network.mean_interarrival_time_sec)
+        self.network.event_queue.push(Event(event_timestamp, self.id, self.id, TXN_CREATE, data=None))
 
-    def transaction_create_handler(self, event_timestamp):
+    def transaction_create_handler(self, data=None, source_node_id=None):
         """method to create a txn and handle it"""
-        receiver_id = random.choice(self.get_neighbors())
+        event_timestamp = self.network.time
+        receiver_id = self.txn_rng.choice(self.neighbor_list)
         while self.id == receiver_id:
-            receiver_id = random.choice(self.get_neighbors())
+            receiver_id = self.txn_rng.choice(self.neighbor_list)
         self_balance = round(float(self.get_amount(self.id)), 4)
-        amount = round(random.uniform(0.0, self_balance), 4)
-        txn = Transaction(event_timestamp, amount, self.id, receiver_id)
+        amount = round(self.txn_rng.uniform(0.0, self_balance), 4)
+        txn_id = self.network.txn_table.create(event_timestamp, amount, self.id, receiver_id)
 
         # log.debug(
         #     "Txn_create -> sender %s, receiver %s, amount %s, sender_balance %s",
@@ -84,14 +133,14 @@ class Node:
         # )
         # log.info(txn.__str_v2__())
 
-        self.txn_pool[txn.id] = txn
-        self.txn_registry.add(txn.id)
-        self.transaction_broadcast(txn)
+        self.txn_pool.add(txn_id, event_timestamp)
+        self.txn_registry.add(txn_id, event_timestamp)
+        self.transaction_broadcast(txn_id, event_timestamp)
         self.transaction_create()
 
-    def transaction_receive_handler(self, txn, source_node_id):
+    def transaction_receive_handler(self, txn_id, source_node_id):
         """method to handle txn receive event"""
-        if txn.id in self.txn_registry or txn.id in self.txn_pool:
+        if txn_id in self.txn_pool or txn_id in self.txn_registry:
             return
         # Commented out to reduce log verbosity
         # log.debug(
@@ -101,133 +150,138 @@ class Node:
         #     txn.amount,
         #     txn.timestamp,
         # )
-        self.txn_pool[txn.id] = txn
-        self.txn_registry.add(txn.id)
-        self.transaction_broadcast(txn, source_node_id)
+        timestamp = float(self.network.txn_table.timestamp[txn_id])
+        self.txn_pool.add(txn_id, timestamp)
+        self.txn_registry.add(txn_id, self.network.time)
+        self.transaction_broadcast(txn_id, timestamp, source_node_id)
 
-    def transaction_broadcast(self, txn, source_node_id=None):
+    def transaction_broadcast(self, txn_id, timestamp, source_node_id=None):
         """broadcast fuction. Broadcast txn to all neighbours, except the node from which it came from"""
-        for node_id in self.get_neighbors():
-            # dont send back to the node from which txn came
-            if source_node_id and node_id == source_node_id:
+        if self.batched_relay:
+            self.relay_buffer.append((txn_id, source_node_id))
+            if not self.flush_scheduled:
+                self.flush_scheduled = True
+                flush_time = self.network.time + self.network.relay_interval
+                self.network.event_queue.push(Event(flush_time, self.id, self.id, TXN_FLUSH, data=None))
+            return
+        links = self.broadcast_links(self.network.transaction_size, source_node_id)
+        self.network.event_queue.multicast(timestamp, self.id, TXN_RECV, txn_id, links)
+
+    def transaction_flush_handler(self, data=None, source_node_id=None):
+        """method to send the buffered txns, one batch per neighbor without the txns that came from it"""
+        buffered = self.relay_buffer
+        self.relay_buffer = []
+        self.flush_scheduled = False
+        events = []
+        for node_id in self.neighbor_list:
+            batch = [txn_id for txn_id, source in buffered if source != node_id]
+            if not batch:
                 continue
-            delay = self.compute_delay(self.network.transaction_size, node_id)
-            self.network.event_queue.push(
-                Event(txn.timestamp + delay, self.id, node_id, "txn_recv", data=deepcopy(txn))
-            )
+            delay = self.compute_delay(len(batch) * self.network.transaction_size, node_id)
+            events.append(Event(self.network.time + delay, self.id, node_id, TXN_BATCH_RECV, data=batch))
+        self.network.event_queue.push_many(events)
+
+    def transaction_batch_receive_handler(self, txn_ids, source_node_id):
+        """method to handle a batch of txns received from a neighbor"""
+        for txn_id in txn_ids:
+            self.transaction_receive_handler(txn_id, source_node_id)
 
     def get_amount(self, node):
-        """return balance of node, obtained from traversing blockchain"""
-        total_balance = 0.0
-        curr_block = self.longest_leaf_hash
-        while curr_block != -1:
-            for txn in self.block_registry[curr_block].txns:
-                if node == txn.receiver_id:
-                    total_balance += txn.amount
-                if node == txn.sender_id:
-                    total_balance -= txn.amount
-            curr_block = self.block_registry[curr_block].prev_hash
-
-        # for txn in self.txn_pool.values():
-        #     if node == txn.receiver_id:
-        #         total_balance += txn.amount
-        #     if node == txn.sender_id:
-        #         total_balance -= txn.amount
-
-        return max(0.0, total_balance)
+        """return balance of node at the tip of the longest chain"""
+        return max(0.0, float(self.ledger.balances(self.longest_leaf_hash)[node]))
 
     def get_balances(self, block_hash):
-        """ "returns a dictionary containing balances of each node"""
-
-        balances = {}
-        for node in self.network.nodes:
-            balances[node.id] = 0.0
-
-        curr_block = block_hash
-        while curr_block != -1:
-            for txn in self.block_registry[curr_block].txns:
-                balances[txn.receiver_id] = balances.get(txn.receiver_id, 0) + txn.amount
-                balances[txn.sender_id] = balances.get(txn.sender_id, 0) - txn.amount
-            curr_block = self.block_registry[curr_block].prev_hash
-
-        # for txn in self.txn_pool.values():
-        #     balances[txn.receiver_id] += txn.amount
-        #     balances[txn.sender_id] -= txn.amount
-
-        if None in balances:
-            del balances[None]
-        return balances
+        """ "returns an array containing balances of each node, indexed by node id"""
+        return self.ledger.balances(block_hash).copy()
 
     def block_create(self):
         """method to create a block and start mining"""
 
         parent_block_hash = self.longest_leaf_hash
-        parent_block_height = self.block_registry[parent_block_hash].height
-        coinbase_txn = Transaction(self.network.time, self.network.mining_reward, None, self.id)
-        txns_to_include = [coinbase_txn]
-
-        true_balances = self.get_balances(parent_block_hash)
-        for txn in self.txn_pool.values():
-            # Assuming honest block creator, Validate transaction
-            sender = txn.sender_id
-            if round(true_balances.get(sender, 0), 4) >= txn.amount:
-                txns_to_include.append(txn)
-                true_balances[txn.sender_id] -= txn.amount
-                true_balances[txn.receiver_id] += txn.amount
-            else:
-                # log.warning(
-                #     "Invalid Txn while mining, Insufficient balance: sender %s, receiver %s, amount %s, sender_balance %s, time %s",
-                #     txn.sender_id,
-                #     txn.receiver_id,
-                #     txn.amount,
-                #     round(true_balances.get(sender, 0), 4),
-                #     round(txn.timestamp, 3),
-                # )
-                pass
-                # true_balances = self.get_balances(parent_block_hash)
-
-            # Don't exceed maximum block size limit
-            if len(txns_to_include) >= self.network.max_txn_in_block:
-                break
-
-        # Create the block with transactions
-        block = Block(self.network.time, parent_block_hash, parent_block_height + 1, deepcopy(txns_to_include))
+        txns_to_include = np.concatenate(([self.coinbase()], self.select_transactions(parent_block_hash)))
+
+        self.start_mining(parent_block_hash, txns_to_include)
+
+    def coinbase(self):
+        """return the id of the coinbase transaction to put in the block being mined"""
+        # mining restarts much more often than it succeeds, so keep the same coinbase until a block is mined
+        if self.coinbase_txn is None:
+            self.coinbase_txn = self.network.txn_table.create(self.network.time, self.network.mining_reward, None, self.id)
+        return self.coinbase_txn
+
+    def select_transactions(self, parent_block_hash):
+        """return the ids of the pool transactions, in pool order, that fit in a block mined on the given parent"""
+        # Assuming honest block creator, skip transactions whose sender can't pay
+        balances = self.ledger.balances(parent_block_hash)
+        # one slot is taken by the coinbase transaction
+        limit = self.network.max_txn_in_block - 1
+        # The selection only looks at the transactions before the ones it takes, so a prefix of the pool
+        # gives the same block as the whole pool once it fills it; widen the prefix only while slots are free
+        window = 2 * limit
+        while True:
+            pool = self.txn_pool.ids(window)
+            senders, receivers, amounts = self.network.txn_table.columns(pool)
+            selected = select_transactions(balances, senders, receivers, amounts, limit)
+            if len(selected) >= limit or len(pool) < window:
+                return pool[selected]
+            window *= 4
+
+    def add_block(self, block):
+        """method to record that this node now has the block"""
+        self.blocks.add(block)
+        self.known_blocks[block.hash] = self.network.time
+
+    def start_mining(self, parent_block_hash, txns):
+        """method to create a block on the given parent and schedule its blk_mine event, replacing the one being mined"""
+        self.stop_mining()
         # Introduce mining delay
-        timestamp = self.network.time + np.random.exponential(self.network.mean_mining_time_sec / self.hashing_power)
+        timestamp = self.network.time + self.mining_rng.exponential(self.network.mean_mining_time_sec / self.hashing_power)
+
+        # Create the block with transactions, it will be mined at timestamp unless mining restarts before
+        parent_block_height = self.blocks[parent_block_hash].height
+        block = Block(
+            self.network.time, parent_block_hash, parent_block_height + 1, txns, self.network.txn_table, mine_time=timestamp
+        )
 
         # Schedule the block mine event
-        self.network.event_queue.push(Event(timestamp, self.id, self.id, "blk_mine", data=block))
+        self.mining_event = Event(timestamp, self.id, self.id, BLK_MINE, data=block)
+        self.network.event_queue.push(self.mining_event)
         self.block_hash_being_mined = block.hash
 
-    def block_mine_handler(self, block):
+    def stop_mining(self):
+        """method to cancel the pending blk_mine event, if any"""
+        if self.mining_event is not None:
+            self.network.event_queue.cancel(self.mining_event)
+            self.mining_event = None
+
+    def block_mine_handler(self, block, source_node_id=None):
         """method to create a block and handle it"""
 
+        self.mining_event = None  # the event being handled has left the queue
         if block.hash != self.block_hash_being_mined:
             return
-        if block.height <= self.block_registry[self.longest_leaf_hash].height:
+        if block.height <= self.blocks[self.longest_leaf_hash].height:
             return
 
         # block sucessfully mined now
-        block.mine_time = self.network.time
-
-        log.info(
-            "Blk_mine -> miner %s, height %s, hash %s, prev_hash %s, mine_time %s",
-            self.id,
-            block.height,
-            block.hash_s,
-            block.prev_hash_s,
-            round(block.mine_time, 3),
-        )
+        self.coinbase_txn = None  # taken by this block, the next one needs a new coinbase
+        if self.log_info:
+            log.info(
+                "Blk_mine -> miner %s, height %s, hash %s, prev_hash %s, mine_time %s",
+                self.id,
+                block.height,
+                block.hash_s,
+                block.prev_hash_s,
+                round(block.mine_time, 3),
+            )
 
         # Add the block hash to block registry
-        self.block_registry[block.hash] = block
+        self.add_block(block)
         # Update longest chain's leaf
         self.longest_leaf_hash = block.hash
 
         # Remove the block transactions from transaction pool
-        for txn in list(block.txns)[1:]:
-            # self.txn_pool.remove(txn)
-            del self.txn_pool[txn.id]
+        self.txn_pool.discard_many(block.txns[1:].tolist())
 
         # Print the coinbase transaction
         # log.debug(str(block.txns[0]))
@@ -239,12 +293,18 @@ class Node:
         self.block_create()
 
     def process_pending_blocks(self, block):
-        """ "if the parent block arrives after the child, remove the child block from pending blocks and process it"""
-        for pending_blk in self.pending_blocks:
-            if pending_blk.prev_hash == block.hash:
-                self.pending_blocks.remove(pending_blk)
-                self.block_receive_handler(pending_blk)
-                break
+        """ "if the parent block arrives after its children, remove the children from pending blocks and process them"""
+        children = self.pending_blocks.pop_children(block.hash)
+        if not children:
+            return
+        self.orphans_to_process.extend(children)
+        if self.processing_orphans:
+            return  # called while processing an orphan, the outer call resolves its descendants
+        # Every processed orphan adds its own children, so whole chains of orphans get resolved
+        self.processing_orphans = True
+        while self.orphans_to_process:
+            self.block_receive_handler(self.orphans_to_process.popleft())
+        self.processing_orphans = False
 
     def block_receive_handler(self, block, source_node_id=None):
         """method to handle block receive event"""
@@ -252,14 +312,14 @@ class Node:
         # Ensure loopless forwarding
         if source_node_id and self.id == source_node_id:
             return
-        if block.hash in self.block_registry:
+        if block.hash in self.known_blocks or block.hash in self.pending_blocks:
             return
 
         last_block_hash = self.longest_leaf_hash
-        last_block = self.block_registry[last_block_hash]
+        last_block = self.blocks[last_block_hash]
 
         # Add to pending blocks if previous block not received
-        if block.prev_hash not in self.block_registry:
+        if block.prev_hash not in self.known_blocks:
             self.pending_blocks.add(block)
             log.warning("Node %s -> adding block %s to pending as parent block %s not arrived", self.id, block.hash_s, block.prev_hash_s)
             return
@@ -268,51 +328,32 @@ class Node:
         if not self.is_block_valid(block):
             return
 
-        log.debug(
-            "Blk_recv -> miner %s, height %s, hash %s, prev_hash %s, mine_time %s",
-            self.id,
-            block.height,
-            block.hash_s,
-            block.prev_hash_s,
-            block.mine_time,
-        )
+        if self.log_debug:
+            log.debug(
+                "Blk_recv -> miner %s, height %s, hash %s, prev_hash %s, mine_time %s",
+                self.id,
+                block.height,
+                block.hash_s,
+                block.prev_hash_s,
+                block.mine_time,
+            )
 
         # Add to block registry
-        self.block_registry[block.hash] = block
+        self.add_block(block)
 
         # Remove these txns from txn_pool
-        for txn in list(block.txns)[1:]:
-            if txn.id in self.txn_pool:
-                del self.txn_pool[txn.id]
+        self.txn_pool.discard_many(block.txns[1:].tolist())
 
         # Find the longest chain and add the block accordingly
         if block.height > last_block.height:
 
             if block.prev_hash != last_block_hash:
-                old_branch = self.longest_leaf_hash
-                new_branch = block.prev_hash
-                log.info(
-                    "Node %s changing mining branch from %s to %s", self.id, self.longest_leaf_hash, block.prev_hash
-                )
-
-                while old_branch != new_branch:
-                    old_block = self.block_registry[old_branch]
-                    new_block = self.block_registry[new_branch]
-
-                    # Undo transactions of old branch
-                    for txn in old_block.txns[1:]:
-                        self.txn_pool[txn.id] = txn
-
-                    # Redo transactions of new branch
-                    for txn in new_block.txns[1:]:
-                        if txn in self.txn_pool:
-                            del self.txn_pool[txn.id]
-
-                    old_branch = old_block.prev_hash
-                    new_branch = new_block.prev_hash
-
-                # sort the txn_pool here according to timestamp
-                self.txn_pool = dict(sorted(self.txn_pool.items(), key=lambda x: x[1].timestamp))
+                if self.log_info:
+                    log.info(
+                        "Node %s changing mining branch from %s to %s", self.id, self.longest_leaf_hash, block.prev_hash
+                    )
+                # the new block is part of the redone branch, its transactions may be in the undone one too
+                self.switch_branch(self.longest_leaf_hash, block.hash)
 
             self.longest_leaf_hash = block.hash
 
@@ -326,17 +367,45 @@ class Node:
         # Broadcast Block
         self.block_broadcast(block, source_node_id)
 
+    def switch_branch(self, old_leaf_hash, new_leaf_hash):
+        """method to move the txn_pool from one branch to another, the branches may have different heights
+
+        returns the number of blocks of the old branch that were undone
+        """
+        fork_hash = self.blocks.fork_point(old_leaf_hash, new_leaf_hash)
+        undone_blocks = self.branch_blocks(old_leaf_hash, fork_hash)
+        redone_blocks = self.branch_blocks(new_leaf_hash, fork_hash)
+
+        # Undo transactions of old branch
+        if undone_blocks:
+            undone_txns = np.concatenate([old_block.txns[1:] for old_block in undone_blocks])
+            self.txn_pool.restore(undone_txns.tolist(), self.network.txn_table.timestamp[undone_txns].tolist())
+
+        # Redo transactions of new branch
+        for new_block in redone_blocks:
+            self.txn_pool.discard_many(new_block.txns[1:].tolist())
+        return len(undone_blocks)
+
+    def branch_blocks(self, leaf_hash, fork_hash):
+        """method to return the blocks from a leaf back to a fork point, the fork point excluded"""
+        blocks = []
+        while leaf_hash != fork_hash:
+            block = self.blocks[leaf_hash]
+            blocks.append(block)
+            leaf_hash = block.prev_hash
+        return blocks
+
     def is_block_valid(self, block):
         """method to check if block is valid"""
 
         # Validate Previous Block height
         prev_blk_hash = block.prev_hash
-        prev_blk = self.block_registry[prev_blk_hash]
+        prev_blk = self.blocks[prev_blk_hash]
         if prev_blk.height + 1 != block.height:
             log.warning("Received Invalid Block: Invalid Index %s", block.height)
             return False
 
-        # Validate Hash
+        # Validate Hash, only the header is hashed as the transactions are committed by the merkle root
         if block.hash != block.block_hash():
             log.warning("Received Invalid Block: Hash mismatch %s", block.height)
             return False
@@ -351,35 +420,22 @@ class Node:
             return False
 
         # Check if the mining reward is correct
-        coinbase_txn = block.txns[0]
-        if coinbase_txn.amount > self.network.mining_reward:  # Max Mining Reward
-            log.warning("Received Invalid Block: Mining fee more than maximum mining fee, %s", coinbase_txn)
+        txn_table = self.network.txn_table
+        if txn_table.amount[block.txns[0]] > self.network.mining_reward:  # Max Mining Reward
+            log.warning("Received Invalid Block: Mining fee more than maximum mining fee, %s", txn_table[block.txns[0]])
             return False
 
         # Validate Transactions
-        true_balances = self.get_balances(prev_blk_hash)
-        for txn in block.txns[1:]:
-            sender = txn.sender_id
-            if round(true_balances.get(sender, 0), 4) < txn.amount:
-                log.warning(
-                    "Received Invalid Block: insufficient sender(%s) balance, cache:%s, txn:%s",
-                    sender,
-                    true_balances[sender],
-                    txn.amount,
-                )
-                return False
-            else:
-                true_balances[txn.sender_id] -= txn.amount
-                true_balances[txn.receiver_id] += txn.amount
+        senders, receivers, amounts = txn_table.columns(block.txns[1:])
+        failed = first_overdraft(self.ledger.balances(prev_blk_hash), senders, receivers, amounts)
+        if failed >= 0:
+            txn = txn_table[block.txns[1 + failed]]
+            log.warning("Received Invalid Block: insufficient sender(%s) balance, txn:%s", txn.sender_id, txn.amount)
+            return False
         return True
 
     def block_broadcast(self, block, source_node_id=None):
         """method to broadcast block"""
-        for node_id in self.get_neighbors():
-            if source_node_id and node_id == source_node_id:
-                continue
-            block_size = len(block.txns) * self.network.transaction_size
-            delay = self.compute_delay(block_size, node_id)
-            self.network.event_queue.push(
-                Event(self.network.time + delay, self.id, node_id, "blk_recv", data=deepcopy(block))
-            )
+        block_size = len(block.txns) * self.network.transaction_size
+        links = self.broadcast_links(block_size, source_node_id)
+        self.network.event_queue.multicast(self.network.time, self.id, BLK_RECV, block, links)
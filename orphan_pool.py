@@ -0,0 +1,51 @@
+"""module to hold blocks whose parent block hasn't arrived yet"""
+
+from collections import OrderedDict
+
+
+class OrphanPool:
+    """Class to keep orphan blocks indexed by the hash of their missing parent
+
+    The pool holds at most max_size blocks; when it is full the oldest orphan is evicted.
+    """
+
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self.blocks = OrderedDict()  # Hash -> Block, oldest first
+        self.children = {}  # prev_hash -> {Hash -> Block}
+        self.added_count = 0
+        self.evicted_count = 0
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def __contains__(self, block_hash):
+        return block_hash in self.blocks
+
+    def add(self, block):
+        """add an orphan block, evicting the oldest one if the pool is full"""
+        if block.hash in self.blocks:
+            return
+        if len(self.blocks) >= self.max_size:
+            self.remove(next(iter(self.blocks)))
+            self.evicted_count += 1
+        self.blocks[block.hash] = block
+        self.added_count += 1
+        self.children.setdefault(block.prev_hash, {})[block.hash] = block
+
+    def remove(self, block_hash):
+        """remove an orphan block from the pool"""
+        block = self.blocks.pop(block_hash)
+        siblings = self.children[block.prev_hash]
+        del siblings[block_hash]
+        if not siblings:
+            del self.children[block.prev_hash]
+
+    def pop_children(self, block_hash):
+        """remove and return the orphans whose parent is the given block, oldest first"""
+        children = self.children.pop(block_hash, None)
+        if not children:
+            return []
+        for child_hash in children:
+            del self.blocks[child_hash]
+        return list(children.values())
@@ -0,0 +1,84 @@
+"""module to draw the random numbers of the simulation from buffered, reproducible streams"""
+
+import numpy as np
+
+# Bounds of the numbers a buffer holds, and the memory the buffers of all the streams of a simulation should
+# stay within: a float in a list takes about 32 bytes, its 24-byte object and the 8-byte pointer to it
+MIN_BUFFER_SIZE = 16
+MAX_BUFFER_SIZE = 1024
+BUFFER_MEMORY_BYTES = 16 * 1024 * 1024
+NUMBER_BYTES = 32
+
+
+class RandomStream:
+    """Class to draw random numbers from its own np.random.Generator in batches
+
+    Drawing one number from NumPy costs far more than the number itself, so standard
+    exponential and uniform variates are drawn buffer_size at a time and scaled on each
+    call. Every stream has its own generator seeded from a SeedSequence, and spawn()
+    derives independent child streams from it, so a simulation is reproduced by its
+    seed alone and the numbers one stream sees don't depend on how much the others drew.
+    The exponential and uniform buffers share the generator, so the numbers drawn depend
+    on the buffer size too.
+    """
+
+    def __init__(self, seed_sequence, buffer_size=1024):
+        self.seed_sequence = seed_sequence
+        self.numpy_generator = None  # created on first use, most streams of a big network draw little or nothing
+        self.buffer_size = buffer_size
+        self.exponentials = []  # filled on first use
+        self.exponential_index = 0
+        self.uniforms = []
+        self.uniform_index = 0
+
+    @property
+    def generator(self):
+        """the np.random.Generator of the stream"""
+        if self.numpy_generator is None:
+            self.numpy_generator = np.random.Generator(np.random.PCG64(self.seed_sequence))
+        return self.numpy_generator
+
+    @classmethod
+    def from_seed(cls, seed=None, buffer_size=1024):
+        """create the root stream of a simulation, fresh entropy is used if seed is None"""
+        return cls(np.random.SeedSequence(seed), buffer_size)
+
+    def spawn(self):
+        """return a new stream independent of this one and of the streams spawned before"""
+        return RandomStream(self.seed_sequence.spawn(1)[0], self.buffer_size)
+
+    def exponential(self, scale=1.0):
+        """draw from the exponential distribution with the given mean"""
+        index = self.exponential_index
+        if index == len(self.exponentials):
+            self.exponentials = self.generator.standard_exponential(self.buffer_size).tolist()
+            index = 0
+        self.exponential_index = index + 1
+        return scale * self.exponentials[index]
+
+    def uniform(self, low=0.0, high=1.0):
+        """draw from the uniform distribution over [low, high)"""
+        index = self.uniform_index
+        if index == len(self.uniforms):
+            self.uniforms = self.generator.random(self.buffer_size).tolist()
+            index = 0
+        self.uniform_index = index + 1
+        return low + (high - low) * self.uniforms[index]
+
+    def randint(self, low, high):
+        """draw an integer from low to high, both included"""
+        return min(high, low + int(self.uniform() * (high - low + 1)))
+
+    def choice(self, items):
+        """draw one element of a non-empty sequence"""
+        return items[min(len(items) - 1, int(self.uniform() * len(items)))]
+
+    def shuffle(self, items):
+        """shuffle a list in place"""
+        self.generator.shuffle(items)
+
+
+def buffer_size_for(stream_count):
+    """return the buffer size that keeps the two buffers of stream_count streams within BUFFER_MEMORY_BYTES"""
+    size = BUFFER_MEMORY_BYTES // (2 * NUMBER_BYTES * max(1, stream_count))
+    return max(MIN_BUFFER_SIZE, min(MAX_BUFFER_SIZE, size))
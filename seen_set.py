@@ -0,0 +1,141 @@
+"""module to remember which transactions a node has already seen"""
+
+import math
+
+
+class ExactSeenSet:
+    """Class to keep the seen transactions as a bitset indexed by transaction id
+
+    Transaction ids are dense integers shared by the whole network, so one bit per
+    transaction created so far is enough and a lookup never gives a wrong answer.
+    """
+
+    def __init__(self):
+        self.bits = bytearray()
+        self.false_positives = 0
+
+    def __contains__(self, txn_id):
+        byte = txn_id >> 3
+        return byte < len(self.bits) and (self.bits[byte] >> (txn_id & 7)) & 1 == 1
+
+    def add(self, txn_id, timestamp=None):
+        """mark a transaction as seen"""
+        byte = txn_id >> 3
+        if byte >= len(self.bits):
+            self.bits.extend(bytes(max(byte + 1, 2 * len(self.bits)) - len(self.bits)))
+        self.bits[byte] |= 1 << (txn_id & 7)
+
+    def memory_bytes(self):
+        """return the number of bytes used by the set"""
+        return len(self.bits)
+
+    def estimated_fp_rate(self):
+        """return the estimated probability that an unseen transaction is reported as seen"""
+        return 0.0
+
+
+class BloomSeenSet:
+    """Class to keep the seen transactions in two Bloom filters rotated over time
+
+    New transactions go into the current filter and lookups check both filters. Once
+    the current filter is rotation_sec old it becomes the previous one and the oldest
+    filter is cleared, so a transaction is remembered for at least rotation_sec, which
+    must be longer than a transaction takes to reach the whole network. Each filter is
+    sized for capacity transactions at the given false-positive rate, and only allocated
+    when a transaction is added to it, so a node that sees little traffic stays small.
+
+    A false positive makes the node drop a transaction it has never seen. They can't be
+    told apart from real duplicates, so with audit=True an exact set of the transactions
+    is kept on the side to count them; otherwise only the estimated rate is known.
+    """
+
+    MASK64 = (1 << 64) - 1
+
+    def __init__(self, fp_rate=0.001, capacity=65536, rotation_sec=600.0, audit=False):
+        self.num_bits = max(8, math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.rotation_sec = rotation_sec
+        self.num_bytes = (self.num_bits + 7) // 8
+        self.current = bytearray()  # allocated by the first add
+        self.previous = bytearray()
+        self.current_count = 0
+        self.previous_count = 0
+        self.rotated_at = 0.0
+        self.audit = set() if audit else None
+        self.false_positives = 0
+
+    def positions(self, txn_id):
+        """return the bit positions of a transaction, by double hashing a mix of its id"""
+        h = (txn_id * 0x9E3779B97F4A7C15) & self.MASK64
+        h = ((h ^ (h >> 30)) * 0xBF58476D1CE4E5B9) & self.MASK64
+        h = ((h ^ (h >> 27)) * 0x94D049BB133111EB) & self.MASK64
+        h ^= h >> 31
+        h1 = h & 0xFFFFFFFF
+        h2 = (h >> 32) | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    @staticmethod
+    def test(bits, positions):
+        """return whether all the given bits are set"""
+        for position in positions:
+            if not (bits[position >> 3] >> (position & 7)) & 1:
+                return False
+        return True
+
+    def __contains__(self, txn_id):
+        # an empty filter may not be allocated yet
+        if not (self.current_count or self.previous_count):
+            return False
+        positions = self.positions(txn_id)
+        found = (self.current_count > 0 and self.test(self.current, positions)) or (
+            self.previous_count > 0 and self.test(self.previous, positions)
+        )
+        if found and self.audit is not None and txn_id not in self.audit:
+            self.false_positives += 1
+        return found
+
+    def add(self, txn_id, timestamp):
+        """mark a transaction as seen at the given simulation time"""
+        if timestamp - self.rotated_at >= self.rotation_sec:
+            self.rotate(timestamp)
+        bits = self.current
+        if not bits:
+            bits = self.current = bytearray(self.num_bytes)
+        for position in self.positions(txn_id):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.current_count += 1
+        if self.audit is not None:
+            self.audit.add(txn_id)
+
+    def rotate(self, timestamp):
+        """start a new filter, forgetting the transactions of the previous one"""
+        self.previous, self.current = self.current, self.previous
+        self.previous_count, self.current_count = self.current_count, 0
+        if self.previous_count == 0:
+            self.previous = bytearray()  # nothing was added in the last period, free its filter
+        self.current[:] = bytes(len(self.current))
+        self.rotated_at = timestamp
+
+    def memory_bytes(self):
+        """return the number of bytes used by the filters, without the audit set"""
+        return len(self.current) + len(self.previous)
+
+    def estimated_fp_rate(self):
+        """return the estimated probability that an unseen transaction is reported as seen"""
+        rates = [
+            (1 - math.exp(-self.num_hashes * count / self.num_bits)) ** self.num_hashes
+            for count in (self.current_count, self.previous_count)
+        ]
+        return 1 - (1 - rates[0]) * (1 - rates[1])
+
+
+SEEN_SET_KINDS = {"exact": ExactSeenSet, "bloom": BloomSeenSet}
+
+
+def make_seen_set(kind="exact", fp_rate=0.001, capacity=65536, rotation_sec=600.0, audit=False):
+    """Create an empty seen-set of the given kind, the other parameters only apply to the bloom filter"""
+    if kind not in SEEN_SET_KINDS:
+        raise ValueError(f"Unknown seen set '{kind}', expected one of {list(SEEN_SET_KINDS)}")
+    if kind == "bloom":
+        return BloomSeenSet(fp_rate, capacity, rotation_sec, audit)
+    return SEEN_SET_KINDS[kind]()
@@ -0,0 +1,209 @@
+"""
+sweep.py
+
+This script runs the network simulation over a grid of parameters, several replications per grid point,
+in parallel on all cores. Nothing is plotted or dumped; the metrics of Network.collect_metrics are averaged
+per grid point and written to a single CSV or JSON file with 95% confidence intervals.
+
+Usage:
+    python sweep.py config_file --param section.option=value1,value2 [--param ...]
+                    [--replications R] [--seed S] [--workers W] [--output FILE]
+
+Arguments:
+    config_file     Path to the configuration file, the base of every run.
+    --param         Option to sweep and the comma-separated values it takes, may be repeated. The grid
+                    is every combination of the values.
+    --replications  Number of runs of each grid point, with seeds S, S + 1, ... (default 5). Every grid point
+                    uses the same seeds, so differences between points aren't blurred by the random numbers.
+    --seed          First seed, defaults to the seed of the configuration file or 1.
+    --workers       Number of worker processes, defaults to the number of cores.
+    --output        Result file, JSON if it ends with .json and CSV otherwise (default sweep_results.csv).
+
+Runs found in the result cache of the configuration ([simulation] result_cache) aren't simulated again.
+
+Example:
+    python3 sweep.py config.ini --param simulation.percent_slow_nodes=10,50,90 \\
+        --param node.adversary_one_mining_power=10,30 --replications 10 --output sweep.json
+"""
+
+import argparse
+import configparser
+import contextlib
+import csv
+import itertools
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from network import Network
+from logger import init_logger
+from cache import ResultCache, run_key
+
+# Two-sided 95% critical values of Student's t distribution by degrees of freedom
+T_TABLE = {
+    1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262, 10: 2.228,
+    11: 2.201, 12: 2.179, 13: 2.160, 14: 2.145, 15: 2.131, 16: 2.120, 17: 2.110, 18: 2.101, 19: 2.093, 20: 2.086,
+    21: 2.080, 22: 2.074, 23: 2.069, 24: 2.064, 25: 2.060, 26: 2.056, 27: 2.052, 28: 2.048, 29: 2.045, 30: 2.042,
+    40: 2.021, 60: 2.000, 120: 1.980,
+}
+
+
+def t_critical(degrees_of_freedom):
+    """return the two-sided 95% critical value of the t distribution, rounded to the safe side between table rows"""
+    if degrees_of_freedom > 120:
+        return 1.960
+    return T_TABLE[max(df for df in T_TABLE if df <= degrees_of_freedom)]
+
+
+def parse_param(text):
+    """parse 'section.option=v1,v2' into ((section, option), [v1, v2])"""
+    name, _, values = text.partition("=")
+    section, _, option = name.partition(".")
+    if not (section and option and values):
+        raise argparse.ArgumentTypeError(f"expected section.option=value1,value2,... got '{text}'")
+    return (section, option), [value.strip() for value in values.split(",")]
+
+
+def expand_grid(params):
+    """return every combination of the swept values as a list of {(section, option): value}"""
+    names = [name for name, _ in params]
+    return [dict(zip(names, values)) for values in itertools.product(*(values for _, values in params))]
+
+
+def flatten_metrics(metrics):
+    """return the numeric metrics of a run in a flat dictionary, the adversaries as adversary_one and adversary_two"""
+    flat = {key: value for key, value in metrics.items() if isinstance(value, (int, float))}
+    for label, adversary in zip(("adversary_one", "adversary_two"), metrics["mpu_adversary_nodes"]):
+        flat[f"mpu_{label}"] = adversary["mpu"]
+        flat[f"mined_blocks_{label}"] = adversary["mined_blocks"]
+        flat[f"accepted_blocks_{label}"] = adversary["accepted_blocks"]
+    return flat
+
+
+def run_replication(sections, seed):
+    """run one simulation of the configuration given as {section: {option: value}} and return its metrics"""
+    config = configparser.ConfigParser()
+    config.read_dict(sections)
+    config["simulation"]["seed"] = str(seed)
+
+    cache, key = None, None
+    if config["simulation"].get("result_cache", ""):
+        max_bytes = int(float(config["simulation"].get("result_cache_max_mb", 1024)) * 1024 * 1024)
+        cache = ResultCache(config["simulation"]["result_cache"], max_bytes)
+        key = run_key(config, seed)
+        cached = cache.get(key)
+        if cached is not None:
+            return flatten_metrics(cached[0])
+
+    start_time = time.time()
+    with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+        network = Network(config, type="toml")
+        network.prepare_simulation()
+        network.start_simulation()
+        metrics = network.collect_metrics()
+    if cache is not None:
+        cache.put(key, metrics)
+    metrics = flatten_metrics(metrics)
+    metrics["run_time_sec"] = time.time() - start_time
+    return metrics
+
+
+def summarize(values):
+    """return the mean, the half-width of the 95% confidence interval and the count of the finite values"""
+    values = [value for value in values if math.isfinite(value)]
+    count = len(values)
+    if count == 0:
+        return {"mean": None, "ci95": None, "n": 0}
+    mean = sum(values) / count
+    if count == 1:
+        return {"mean": mean, "ci95": None, "n": 1}
+    std = math.sqrt(sum((value - mean) ** 2 for value in values) / (count - 1))
+    return {"mean": mean, "ci95": t_critical(count - 1) * std / math.sqrt(count), "n": count}
+
+
+def aggregate(grid, runs):
+    """return one summary per grid point, runs maps the index of a grid point to the metrics of its replications"""
+    points = []
+    for index, point in enumerate(grid):
+        replications = runs[index]
+        metric_names = sorted({name for metrics in replications for name in metrics})
+        points.append(
+            {
+                "params": {f"{section}.{option}": value for (section, option), value in point.items()},
+                "metrics": {
+                    name: summarize([metrics[name] for metrics in replications if name in metrics])
+                    for name in metric_names
+                },
+            }
+        )
+    return points
+
+
+def write_results(points, path):
+    """write the summaries as JSON if the path ends with .json, as CSV with one row per grid point otherwise"""
+    if path.endswith(".json"):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"points": points}, f, indent=2)
+        return
+
+    param_names = list(points[0]["params"]) if points else []
+    metric_names = sorted({name for point in points for name in point["metrics"]})
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        header = param_names + [f"{name}_{field}" for name in metric_names for field in ("mean", "ci95", "n")]
+        writer.writerow(header)
+        for point in points:
+            row = [point["params"][name] for name in param_names]
+            for name in metric_names:
+                summary = point["metrics"].get(name, {"mean": None, "ci95": None, "n": 0})
+                row += ["" if summary[field] is None else summary[field] for field in ("mean", "ci95", "n")]
+            writer.writerow(row)
+
+
+def run_sweep(config, params, replications, first_seed, workers=None):
+    """run every replication of every grid point in a process pool, return the grid and the aggregated results"""
+    grid = expand_grid(params)
+    base = {section: dict(config[section]) for section in config.sections()}
+    base["simulation"]["debug"] = "False"
+
+    runs = {index: [None] * replications for index in range(len(grid))}
+    total = len(grid) * replications
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_logger, initargs=("ERROR",)) as executor:
+        futures = {}
+        for index, point in enumerate(grid):
+            sections = {section: dict(options) for section, options in base.items()}
+            for (section, option), value in point.items():
+                sections.setdefault(section, {})[option] = value
+            for replication in range(replications):
+                future = executor.submit(run_replication, sections, first_seed + replication)
+                futures[future] = (index, replication)
+        for done, future in enumerate(as_completed(futures), start=1):
+            index, replication = futures[future]
+            runs[index][replication] = future.result()
+            point = ", ".join(f"{section}.{option}={value}" for (section, option), value in grid[index].items())
+            print(f"[{done}/{total}] finished replication {replication} of {point or 'the base configuration'}")
+    return grid, aggregate(grid, runs)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("config_file", type=str, help="Configuration file, the base of every run")
+    parser.add_argument("--param", type=parse_param, action="append", default=[], help="section.option=v1,v2,...")
+    parser.add_argument("--replications", type=int, default=5, help="Runs of each grid point")
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the first replication")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes, defaults to the number of cores")
+    parser.add_argument("--output", type=str, default="sweep_results.csv", help="Result file, .json or .csv")
+    args = parser.parse_args()
+
+    config = configparser.ConfigParser()
+    config.read(args.config_file)
+    seed = args.seed
+    if seed is None:
+        seed = int(config["simulation"].get("seed", "") or 1)
+
+    grid, points = run_sweep(config, args.param, args.replications, seed, args.workers)
+    write_results(points, args.output)
+    print(f"{len(grid)} grid points x {args.replications} replications written to {args.output}")
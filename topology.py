@@ -0,0 +1,172 @@
+"""module to generate random connected network topologies with bounded degrees"""
+
+import os
+import numpy as np
+
+from rng import RandomStream
+
+TOPOLOGY_VERSION = 1  # part of the cache file names, bump it when the generator changes
+TOPOLOGY_STREAM = 1  # mixed into the seed, so the topology doesn't share numbers with the simulation
+TOPOLOGY_ATTEMPTS = 32  # fresh draws before giving up, tight bounds on small graphs sometimes need a few
+
+
+def random_topology(num_nodes, min_degree, max_degree, rng):
+    """return the neighbor sets of a random connected graph whose degrees are all in [min_degree, max_degree]
+
+    Bounds no graph can meet raise a ValueError. A graph where every node must be linked
+    to all the others is built directly, otherwise graphs are drawn with draw_topology
+    until one succeeds; the draws come from rng, so a seed still gives one topology.
+    """
+    if min_degree > max_degree:
+        raise ValueError(f"min_neighbors {min_degree} is larger than max_neighbors {max_degree}")
+    if num_nodes > 1 and min_degree > num_nodes - 1:
+        raise ValueError(f"{num_nodes} nodes can't have {min_degree} neighbors each")
+    if num_nodes > 2 and max_degree < 2:
+        raise ValueError(f"{num_nodes} nodes can't be connected with at most {max_degree} neighbors each")
+    if min_degree == max_degree and num_nodes * min_degree % 2 == 1:
+        raise ValueError(f"{num_nodes} nodes can't have exactly {min_degree} neighbors each, the sum of degrees is odd")
+
+    if min_degree >= num_nodes - 1:
+        return [set(range(num_nodes)) - {node} for node in range(num_nodes)]
+
+    for _ in range(TOPOLOGY_ATTEMPTS - 1):
+        try:
+            return draw_topology(num_nodes, min_degree, max_degree, rng)
+        except RuntimeError:
+            continue
+    return draw_topology(num_nodes, min_degree, max_degree, rng)
+
+
+def draw_topology(num_nodes, min_degree, max_degree, rng):
+    """draw the neighbor sets of a random connected graph whose degrees are all in [min_degree, max_degree]
+
+    A random spanning tree makes the graph connected. Every node then draws a target
+    degree in the range and the missing edges are made by pairing the free slots at
+    random, like in the configuration model. Pairs that would give a self-loop or a
+    duplicate edge are dropped, and the few nodes left below min_degree are repaired:
+    they are linked to random nodes with a free slot, or, when there are none, an edge
+    outside the tree is rewired to them. Everything takes expected time linear in the
+    number of edges. Very tight bounds on a small graph can leave no edge to rewire,
+    which raises a RuntimeError; random_topology then draws again.
+    """
+    neighbors = [set() for _ in range(num_nodes)]
+
+    def link(a, b):
+        neighbors[a].add(b)
+        neighbors[b].add(a)
+
+    # Random spanning tree, every node is attached to a random earlier node with a free slot
+    tree_edges = set()  # (smaller id, larger id), these are never removed so the graph stays connected
+    order = list(range(num_nodes))
+    rng.shuffle(order)
+    open_nodes = order[:1]
+    for node in order[1:]:
+        index = rng.randint(0, len(open_nodes) - 1)
+        parent = open_nodes[index]
+        link(parent, node)
+        tree_edges.add((min(parent, node), max(parent, node)))
+        if len(neighbors[parent]) >= max_degree:
+            open_nodes[index] = open_nodes[-1]
+            open_nodes.pop()
+        open_nodes.append(node)
+
+    # Pair the free slots up to every node's target degree
+    stubs = []
+    for node in range(num_nodes):
+        stubs.extend([node] * (rng.randint(min_degree, max_degree) - len(neighbors[node])))
+    rng.shuffle(stubs)
+    for a, b in zip(stubs[0::2], stubs[1::2]):
+        if a != b and b not in neighbors[a] and len(neighbors[a]) < max_degree and len(neighbors[b]) < max_degree:
+            link(a, b)
+
+    def open_node(excluded, attempts=16):
+        """return a random node with a free slot that is not in excluded, or None"""
+        for _ in range(attempts):
+            if not open_nodes:
+                return None
+            index = rng.randint(0, len(open_nodes) - 1)
+            candidate = open_nodes[index]
+            if len(neighbors[candidate]) >= max_degree:
+                open_nodes[index] = open_nodes[-1]
+                open_nodes.pop()
+            elif candidate not in excluded:
+                return candidate
+        return None
+
+    def spare_edge(excluded_a, excluded_b):
+        """return a random edge (a, b) outside the spanning tree with a not in excluded_a and b not in excluded_b"""
+        for _ in range(16 * num_nodes):
+            a = rng.randint(0, num_nodes - 1)
+            if a in excluded_a or not neighbors[a]:
+                continue
+            b = rng.choice(sorted(neighbors[a]))
+            if b not in excluded_b and (min(a, b), max(a, b)) not in tree_edges:
+                return a, b
+        raise RuntimeError("Can't find an edge to rewire, the degree bounds are too tight")
+
+    def unlink(a, b):
+        neighbors[a].discard(b)
+        neighbors[b].discard(a)
+
+    # Repair the nodes still below min_degree, rewiring edges that are not in the tree keeps the graph connected
+    open_nodes = [node for node in range(num_nodes) if len(neighbors[node]) < max_degree]
+    for node in range(num_nodes):
+        while len(neighbors[node]) < min_degree:
+            excluded = neighbors[node] | {node}
+            partner = open_node(excluded)
+            if partner is not None:
+                link(node, partner)
+            elif len(neighbors[node]) + 2 <= max_degree:
+                # a-b becomes a-node-b
+                a, b = spare_edge(excluded, excluded)
+                unlink(a, b)
+                link(node, a)
+                link(node, b)
+            else:
+                # only one slot left, a-b becomes node-a and partner-b with partner another node with a free slot
+                partner = open_node({node}, attempts=16 * num_nodes)
+                if partner is None:
+                    raise RuntimeError(f"Can't give node {node} {min_degree} neighbors with at most {max_degree} each")
+                if partner not in excluded:
+                    link(node, partner)
+                    continue
+                a, b = spare_edge(excluded | {partner}, neighbors[partner] | {partner, node})
+                unlink(a, b)
+                link(node, a)
+                link(partner, b)
+    return neighbors
+
+
+def to_csr(neighbors):
+    """return the offsets and neighbor ids arrays of a list of neighbor sets, the neighbors of each node sorted"""
+    degrees = np.array([len(node_neighbors) for node_neighbors in neighbors], dtype=np.int64)
+    offsets = np.zeros(len(neighbors) + 1, dtype=np.int64)
+    np.cumsum(degrees, out=offsets[1:])
+    neighbor_ids = np.array([i for node_neighbors in neighbors for i in sorted(node_neighbors)], dtype=np.int64)
+    return offsets, neighbor_ids
+
+
+def load_or_create_topology(num_nodes, min_degree, max_degree, seed=None, cache_dir=None, rng=None):
+    """return the CSR arrays (offsets, neighbor ids) of a random topology
+
+    With a seed the topology only depends on the seed and the parameters. If cache_dir
+    is also given, it is read from there when it was generated before and saved there
+    otherwise. Without a seed the numbers are drawn from rng and nothing is cached.
+    """
+    if seed is None:
+        return to_csr(random_topology(num_nodes, min_degree, max_degree, rng or RandomStream.from_seed()))
+
+    path = None
+    if cache_dir:
+        name = f"topology_v{TOPOLOGY_VERSION}_n{num_nodes}_d{min_degree}-{max_degree}_s{seed}.npz"
+        path = os.path.join(cache_dir, name)
+        if os.path.exists(path):
+            with np.load(path) as cached:
+                return cached["offsets"], cached["neighbor_ids"]
+
+    rng = RandomStream.from_seed([seed, TOPOLOGY_STREAM])
+    offsets, neighbor_ids = to_csr(random_topology(num_nodes, min_degree, max_degree, rng))
+    if path:
+        os.makedirs(cache_dir, exist_ok=True)
+        np.savez(path, offsets=offsets, neighbor_ids=neighbor_ids)
+    return offsets, neighbor_ids
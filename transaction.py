@@ -1,17 +1,114 @@
 """module to represent a transaction in the blockchain network"""
 
-from uuid import uuid4
+from hashlib import sha256
+import numpy as np
+
+
+class TransactionTable:
+    """class to store every transaction of the simulation as columns of arrays
+
+    A transaction is identified by its row, an integer id that grows by one with every
+    transaction created. Nodes, blocks and events only pass these ids around and read
+    the columns when they need the data, so a transaction costs a few dozen bytes and no
+    Python object. Rows are never modified once written.
+    """
+    COINBASE_SENDER = -1  # sender of the coinbase transactions
+
+    def __init__(self, capacity=1024):
+        self.size = 0
+        self.timestamp = np.empty(capacity, dtype=np.float64)
+        self.sender = np.empty(capacity, dtype=np.int64)
+        self.receiver = np.empty(capacity, dtype=np.int64)
+        self.amount = np.empty(capacity, dtype=np.float64)
+        self.digest = np.empty((capacity, 32), dtype=np.uint8)  # leaves of the block merkle trees
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, txn_id):
+        if not 0 <= txn_id < self.size:
+            raise IndexError(f"Unknown transaction {txn_id}")
+        return Transaction(self, int(txn_id))
+
+    def create(self, ts, amount, sender_id, receiver_id):
+        """method to add a transaction and return its id, sender_id is None for a coinbase transaction"""
+        txn_id = self.size
+        if txn_id == len(self.amount):
+            self.grow()
+        sender_id = self.COINBASE_SENDER if sender_id is None else sender_id
+        amount = float(amount)
+        self.timestamp[txn_id] = ts
+        self.sender[txn_id] = sender_id
+        self.receiver[txn_id] = receiver_id
+        self.amount[txn_id] = amount
+        self.digest[txn_id] = np.frombuffer(
+            sha256(f"{txn_id}: {sender_id} pays {receiver_id} {amount} coins".encode()).digest(), dtype=np.uint8
+        )
+        self.size += 1
+        return txn_id
+
+    def grow(self):
+        """method to double the capacity of every column"""
+        capacity = 2 * len(self.amount)
+        for column in ("timestamp", "sender", "receiver", "amount", "digest"):
+            old = getattr(self, column)
+            new = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[: self.size] = old[: self.size]
+            setattr(self, column, new)
+
+    def columns(self, txn_ids):
+        """return the senders, receivers and amounts of the given transactions as arrays"""
+        return self.sender[txn_ids], self.receiver[txn_ids], self.amount[txn_ids]
+
+    def digests(self, txn_ids):
+        """return the digests of the given transactions as a list of bytes"""
+        data = self.digest[txn_ids].tobytes()
+        return [data[i : i + 32] for i in range(0, len(data), 32)]
 
 
 class Transaction:
-    """class to represent a transaction in the blockchain network"""
-    def __init__(self, ts, amount, sender_id, receiver_id):
+    """class to represent a transaction in the blockchain network
+
+    A read-only view of one row of the TransactionTable.
+    """
+    __slots__ = ("table", "id")
+
+    def __init__(self, table, txn_id):
         """"method to initialize attributes of transaction"""
-        self.id = str(uuid4())
-        self.timestamp = ts
-        self.sender_id = sender_id
-        self.receiver_id = receiver_id
-        self.amount = float(amount)
+        object.__setattr__(self, "table", table)
+        object.__setattr__(self, "id", txn_id)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"Transaction is immutable, can't set '{name}'")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"Transaction is immutable, can't delete '{name}'")
+
+    @property
+    def timestamp(self):
+        """time at which the transaction was created"""
+        return float(self.table.timestamp[self.id])
+
+    @property
+    def sender_id(self):
+        """id of the paying node, None for a coinbase transaction"""
+        sender_id = int(self.table.sender[self.id])
+        return None if sender_id == TransactionTable.COINBASE_SENDER else sender_id
+
+    @property
+    def receiver_id(self):
+        """id of the paid node"""
+        return int(self.table.receiver[self.id])
+
+    @property
+    def amount(self):
+        """number of coins transferred"""
+        return float(self.table.amount[self.id])
+
+    @property
+    def digest(self):
+        """sha256 digest of the transaction"""
+        return self.table.digest[self.id].tobytes()
 
     def __str_v2__(self):
         if self.sender_id is None: